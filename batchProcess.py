@@ -0,0 +1,172 @@
+#########################################################################################
+#                          Batch processing of many chat logs                           #
+#########################################################################################
+# Offline driver that processes a whole archive of #channel_chat.log files at once.
+#
+# Each log is handled by one worker of a process pool, which parses it a single time
+# and from that one pass produces the dataframe, the cleaned chat text and the word
+# counts.  The per-channel results are then reduced into one dataframe, one combined
+# WordVocabulary and one combined cleaned corpus.
+#
+#   Usage:  python batchProcess.py logs/ [more logs or directories] [-p processes]
+#                                  [-o outDir] [--users]
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import glob
+import zlib
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from processChat import read_records, records_to_dataframe, clean_lines, log_head, COLUMNS
+from chatVocab import WordVocabulary
+
+
+
+def find_logs(paths):
+    '''
+    Expands directories in paths to the '*_chat.log' files they contain.
+    '''
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(glob.glob(os.path.join(path, '*_chat.log')))
+        else:
+            logs.append(path)
+    return sorted(set(logs))
+
+
+
+def clean_names(logs):
+    '''
+    Name of the cleaned text file for each log.  Logs with the same file name
+    in different directories get the crc32 of their full path added so no
+    cleaned file overwrites another.
+    '''
+    names = []
+    for logFile in logs:
+        name = os.path.basename(logFile)
+        names.append(name[:-len('.log')] if name.endswith('.log') else name)
+
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+
+    cleaned = []
+    for logFile, name in zip(logs, names):
+        if counts[name] > 1:
+            name += '_%08x' % zlib.crc32(os.path.abspath(logFile).encode('utf-8'))
+        cleaned.append(name + '_clean.txt')
+
+    return cleaned
+
+
+
+def process_log(logFile, outDir, parse=True, clean=True, vocab=True, withUsers=False,
+                cleanName=None):
+    '''
+    Worker, makes one pass over logFile and returns a dictionary with the
+    'chat' dataframe, the 'cleaned' text file and the 'vocab' WordVocabulary
+    for each of the steps selected.  The cleaned text is written to
+    outDir/cleanName, by default named after the log.
+    '''
+    result = {'log': logFile, 'chat': None, 'cleaned': None, 'vocab': None}
+    frames = []
+    words = WordVocabulary()
+
+    cleanFile = None
+    if clean == True:
+        if cleanName is None:
+            cleanName = clean_names([logFile])[0]
+        result['cleaned'] = os.path.join(outDir, cleanName)
+        cleanFile = open(result['cleaned'], 'w', encoding='utf-8')
+
+    offset = 0
+    try:
+        for records, offset in read_records(logFile, includeTail=True):
+            chat = records_to_dataframe(records)
+            if parse == True:
+                frames.append(chat)
+            if clean == True:
+                cleanFile.write(clean_lines(chat, withUsers))
+            if vocab == True:
+                words.update(chat['message'])
+    finally:
+        if cleanFile is not None:
+            cleanFile.close()
+
+    if parse == True:
+        result['chat'] = (pd.concat(frames, ignore_index=True) if frames
+                          else pd.DataFrame(columns=COLUMNS))
+    if vocab == True:
+        words.logs[os.path.abspath(logFile)] = {'offset': offset, 'head': log_head(logFile)}
+        result['vocab'] = words
+
+    return result
+
+
+
+def process_logs(paths, outDir='processed', processes=None, parse=True, clean=True,
+                 vocab=True, withUsers=False):
+    '''
+    Processes every log found in paths across a pool of processes (one per
+    core by default) and returns a dictionary of the reduced results:
+
+    - 'chat' : one dataframe of every channel, sorted by time.
+    - 'vocab' : WordVocabulary merged over all logs, also saved to outDir.
+    - 'cleaned' : the per-channel cleaned files, concatenated into
+                  outDir/allChat_clean.txt as 'corpus'.
+    '''
+    logs = find_logs(paths)
+    os.makedirs(outDir, exist_ok=True)
+
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(pool.map(process_log, logs, [outDir] * len(logs), [parse] * len(logs),
+                                [clean] * len(logs), [vocab] * len(logs),
+                                [withUsers] * len(logs), clean_names(logs)))
+
+    combined = {'logs': logs, 'chat': None, 'vocab': None, 'cleaned': None, 'corpus': None}
+
+    if parse == True:
+        frames = [result['chat'] for result in results if len(result['chat']) > 0]
+        chat = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+        combined['chat'] = chat.sort_values('dt', kind='stable').reset_index(drop=True)
+
+    if vocab == True:
+        # Merge in log order so indices do not depend on which worker finished first
+        words = WordVocabulary()
+        for result in results:
+            words.merge(result['vocab'])
+        words.save(os.path.join(outDir, 'vocab.json'))
+        combined['vocab'] = words
+
+    if clean == True:
+        combined['cleaned'] = [result['cleaned'] for result in results]
+        combined['corpus'] = os.path.join(outDir, 'allChat_clean.txt')
+        with open(combined['corpus'], 'wb') as corpus:
+            for cleaned in combined['cleaned']:
+                with open(cleaned, 'rb') as f:
+                    shutil.copyfileobj(f, corpus)
+
+    return combined
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process many chat logs in parallel.')
+    parser.add_argument('paths', nargs='+', help='log files or directories of logs')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('-o', '--out', default='processed')
+    parser.add_argument('--users', action='store_true', help='keep usernames in cleaned text')
+    args = parser.parse_args()
+
+    combined = process_logs(args.paths, args.out, args.processes, withUsers=args.users)
+
+    print('\n%d logs, %d messages, %d words counted'
+          % (len(combined['logs']), len(combined['chat']), len(combined['vocab'].words)))
+    print('Cleaned corpus written to ' + combined['corpus'] + '\n')
@@ -0,0 +1,79 @@
+#########################################################################################
+#                          get_chat_dataframe benchmark                                 #
+#########################################################################################
+# Times the chunked, vectorized get_chat_dataframe() against the original record by
+# record loader on a synthetic #channel_chat.log.
+#
+#   Usage:  python benchmarks/benchChatDataframe.py [records]
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import re
+import sys
+import time
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from processChat import get_chat_dataframe
+from syntheticChat import write_synthetic_log
+
+
+
+def legacy_get_chat_dataframe(logFile):
+    '''
+    The original loader, one strptime and regex search per record.
+    '''
+    data = []
+
+    with open(logFile, 'r', encoding='utf-8') as f:
+        lines = f.read().split('\n\n\n')
+        for line in lines:
+            try:
+                time_logged = line.split(' - ')[0].strip()
+                time_logged = datetime.strptime(time_logged, '%Y-%m-%d_%H:%M:%S')
+
+                username_message = line.split(' - ')[1:]
+                username_message = ''.join(username_message).strip()
+
+                username, channel, message = re.search(
+                    ':(.*)\\!.*@.*\\.tmi\\.twitch\\.tv PRIVMSG #(.*) :(.*)',
+                    username_message).groups()
+
+                data.append({'dt': time_logged, 'channel': channel,
+                             'username': username, 'message': message})
+            except Exception:
+                pass
+
+    return pd.DataFrame().from_records(data)
+
+
+
+if __name__ == '__main__':
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    with tempfile.TemporaryDirectory() as directory:
+        logFile = os.path.join(directory, '#benchmark_chat.log')
+        write_synthetic_log(logFile, records)
+        size = os.path.getsize(logFile) / 2**20
+
+        timer = time.perf_counter()
+        legacy = legacy_get_chat_dataframe(logFile)
+        legacyTime = time.perf_counter() - timer
+
+        timer = time.perf_counter()
+        chat = get_chat_dataframe(logFile)
+        newTime = time.perf_counter() - timer
+
+    assert len(chat) == len(legacy) == records
+
+    print('\n%d records, %.1f MB' % (records, size))
+    print('legacy loader     : %.2f s  (%.1f MB/s)' % (legacyTime, size / legacyTime))
+    print('get_chat_dataframe: %.2f s  (%.1f MB/s)' % (newTime, size / newTime))
+    print('speedup           : %.1fx\n' % (legacyTime / newTime))
@@ -0,0 +1,85 @@
+#########################################################################################
+#                            clean_messages benchmark                                   #
+#########################################################################################
+# Times clean_messages / clean_messages_with_users, serial and with a process pool,
+# against the original character by character cleaning on a synthetic log.
+#
+#   Usage:  python benchmarks/benchCleanMessages.py [records] [processes]
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+import time
+import string
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import processChat
+from processChat import clean_messages, clean_messages_with_users
+from benchChatDataframe import legacy_get_chat_dataframe, write_synthetic_log
+
+
+
+def legacy_clean_messages_with_users(logFile, chatText):
+    '''
+    The original cleaning, two loads of the log and a string scan per character.
+    '''
+    users = legacy_get_chat_dataframe(logFile).values[:,2]
+    messages = legacy_get_chat_dataframe(logFile).values[:,3]
+
+    with open(chatText, 'w', encoding='utf-8') as file:
+        for username, message in zip(users, messages):
+            skip = False
+            for character in list(message):
+                if character not in string.printable:
+                    skip = True
+                    break
+
+            if skip == False:
+                file.write(username + ': ' + message + '\n')
+
+
+
+def timed(function, *args, **kwargs):
+    '''
+    Returns the seconds taken by one call.
+    '''
+    timer = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - timer
+
+
+
+if __name__ == '__main__':
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as directory:
+        logFile = os.path.join(directory, '#benchmark_chat.log')
+        write_synthetic_log(logFile, records, unicodeRate=0.2)
+        size = os.path.getsize(logFile) / 2**20
+
+        # Small ranges so the pool has work to share even on a modest log
+        processChat.RANGE_SIZE = max(1 << 20, int(size * 2**20) // (processes * 4))
+
+        out = [os.path.join(directory, name) for name in ('legacy.txt', 'serial.txt', 'pool.txt')]
+        results = [
+            ('legacy clean_messages_with_users', timed(legacy_clean_messages_with_users,
+                                                       logFile, out[0])),
+            ('clean_messages_with_users', timed(clean_messages_with_users, logFile, out[1])),
+            ('clean_messages_with_users x%d' % processes,
+             timed(clean_messages_with_users, logFile, out[2], processes=processes)),
+            ('clean_messages', timed(clean_messages, logFile, out[1])),
+            ]
+
+        with open(out[0], encoding='utf-8') as legacy, open(out[2], encoding='utf-8') as pool:
+            assert legacy.read() == pool.read()
+
+    print('\n%d records, %.1f MB' % (records, size))
+    for name, seconds in results:
+        print('%-36s: %.2f s  (%.1f MB/s)' % (name, seconds, size / seconds))
+    print()
@@ -0,0 +1,222 @@
+#########################################################################################
+#                                Benchmark suite                                        #
+#########################################################################################
+# Runs every hot path on the same synthetic chat and saves the results as JSON, so runs
+# before and after a change can be compared.
+#
+#   Benchmarks:  - get_chat_dataframe : Load the log into a dataframe.
+#                - clean_messages / clean_messages_with_users : Clean the log.
+#                - chatVocabulary / characterVocab : Build the vocabularies.
+#                - parse_line : Parse raw IRC lines into ChatMessages.
+#                - vote_tally : The vote_counter tally loop over parsed messages.
+#                - contest : ContestEngine.check over parsed messages.
+#
+# Each benchmark is timed repeat times (the best run is kept) and then run once more
+# under tracemalloc for its peak Python memory.  Throughput is reported in records
+# and megabytes of log per second.
+#
+#   Usage:  python benchmarks/benchSuite.py [-n records] [--channels 4] [--unicode 0.2]
+#                                           [--emoji 0.1] [--tags] [-r repeat]
+#                                           [-o results.json] [--compare old.json]
+#                                           [--only name ...] [--no-memory]
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import processChat
+from chatMessage import parse_line
+from voteTally import VoteTally
+from contestEngine import ContestEngine, Contest
+from syntheticChat import synthetic_lines, write_synthetic_log, WORDS, EMOTES
+
+
+
+def _commit():
+    '''
+    Current git commit of the repository, None outside a checkout.
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+def _tally(messages):
+    '''
+    The vote_counter loop, one VoteTally.add_message per message.
+    '''
+    tally = VoteTally(WORDS[:5] + EMOTES[:2], uniqueUsers=True)
+    for message in messages:
+        tally.add_message(message)
+    return tally.results()
+
+
+
+def _contest(messages):
+    '''
+    Ten open contests checked against every message, none of them can close.
+    '''
+    engine = ContestEngine(onWinner=None, uniqueWinners=False)
+    for i in range(10):
+        engine.add(Contest('secret phrase %d' % i, winners=len(messages) + 1,
+                           ignoreCase=i % 2 == 1))
+    engine.add(Contest('hype', winners=len(messages) + 1, wholeWord=True))
+    for message in messages:
+        engine.check(message)
+
+
+
+def _parse(lines):
+    '''
+    Parses every raw line.
+    '''
+    for line in lines:
+        parse_line(line)
+
+
+
+def benchmarks(logFile, directory, lines, messages):
+    '''
+    Dictionary of benchmark name to a function of no arguments.
+    '''
+    out = os.path.join(directory, 'clean.txt')
+    return {
+        'get_chat_dataframe': lambda: processChat.get_chat_dataframe(logFile),
+        'clean_messages': lambda: processChat.clean_messages(logFile, out),
+        'clean_messages_with_users': lambda: processChat.clean_messages_with_users(logFile, out),
+        'chatVocabulary': lambda: processChat.chatVocabulary(logFile),
+        'characterVocab': lambda: processChat.characterVocab(logFile),
+        'parse_line': lambda: _parse(lines),
+        'vote_tally': lambda: _tally(messages),
+        'contest': lambda: _contest(messages),
+    }
+
+
+
+def measure(function, repeat, memory=True):
+    '''
+    Returns the best of repeat timings and, with memory, the tracemalloc peak
+    in bytes of one more call.
+    '''
+    seconds = []
+    for _ in range(repeat):
+        timer = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - timer)
+
+    peak = None
+    if memory == True:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return min(seconds), peak
+
+
+
+def run_suite(records=200000, channels=1, unicodeRate=0.0, emojiRate=0.0, tags=False,
+              repeat=3, only=None, memory=True, seed=0):
+    '''
+    Runs the benchmarks on a fresh synthetic log and returns the results
+    dictionary that is saved as JSON.
+    '''
+    config = {'records': records, 'channels': channels, 'unicodeRate': unicodeRate,
+              'emojiRate': emojiRate, 'tags': tags, 'repeat': repeat, 'seed': seed}
+    results = {}
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        logFile = os.path.join(directory, '#benchmark_chat.log')
+        options = {'channels': channels, 'emojiRate': emojiRate, 'tags': tags, 'seed': seed}
+        write_synthetic_log(logFile, records, unicodeRate=unicodeRate, **options)
+        size = os.path.getsize(logFile) / 2**20
+        config['megabytes'] = size
+
+        lines = [line for _, line in synthetic_lines(records, unicodeRate=unicodeRate, **options)]
+        messages = [parse_line(line) for line in lines]
+
+        # characterVocab writes allChat.txt to the working directory
+        os.chdir(directory)
+        try:
+            for name, function in benchmarks(logFile, directory, lines, messages).items():
+                if only and name not in only:
+                    continue
+                seconds, peak = measure(function, repeat, memory)
+                results[name] = {'seconds': seconds, 'recordsPerSecond': records / seconds,
+                                 'megabytesPerSecond': size / seconds,
+                                 'peakMegabytes': None if peak is None else peak / 2**20}
+                print('%-26s: %7.3f s  %10.0f records/s  %7.1f MB/s  %s'
+                      % (name, seconds, records / seconds, size / seconds,
+                         '' if peak is None else 'peak %.1f MB' % (peak / 2**20)))
+        finally:
+            os.chdir(cwd)
+
+    return {'time': time.strftime('%Y-%m-%d_%H:%M:%S'), 'commit': _commit(),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'config': config, 'results': results}
+
+
+
+def compare(new, old):
+    '''
+    Prints the speedup and memory change of new over old for each benchmark.
+    '''
+    print('\nCompared with %s (%s):' % (old.get('commit'), old.get('time')))
+    if old.get('config') != new['config']:
+        print('(the runs used different settings: %s)' % old.get('config'))
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        if before is None:
+            continue
+        line = '%-26s: %5.2fx speed' % (name, result['recordsPerSecond']
+                                                  / before['recordsPerSecond'])
+        if result['peakMegabytes'] and before.get('peakMegabytes'):
+            line += '  %5.2fx memory' % (result['peakMegabytes'] / before['peakMegabytes'])
+        print(line)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the chat processing hot paths.')
+    parser.add_argument('-n', '--records', type=int, default=200000)
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--unicode', type=float, default=0.2, help='share of accented messages')
+    parser.add_argument('--emoji', type=float, default=0.1, help='share of messages with emoji')
+    parser.add_argument('--tags', action='store_true', help='lines carry IRCv3 tags')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', help='benchmark names to run')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('-o', '--out', default='benchmarkResults.json')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    print()
+    results = run_suite(args.records, args.channels, args.unicode, args.emoji, args.tags,
+                        args.repeat, args.only, not args.no_memory, args.seed)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print('\nResults saved to ' + args.out)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+    print()
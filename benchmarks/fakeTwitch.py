@@ -0,0 +1,286 @@
+#########################################################################################
+#                              Fake Twitch IRC server                                   #
+#########################################################################################
+# Local stand-in for irc.chat.twitch.tv so ChatBot can be load tested offline.
+#
+# FakeTwitchServer accepts PASS / NICK / CAP REQ / JOIN like Twitch does and, once a
+# client has JOINed, replays chat to it at rate messages per second.  Every burstEvery
+# seconds burstSize extra messages are sent at once, PING is sent every pingInterval
+# seconds and answered PONGs are counted.
+#
+# Chat comes either from an existing #channel_chat.log (logFile) or from the synthetic
+# generator in syntheticChat.py (lines).  Every replayed line is re-addressed to the
+# JOINed channel.  A client that requested twitch.tv/tags gets each line with the tags
+#
+#     id=<sequence number>;tmi-sent-ts=<time the line was due, ms>
+#
+# so the client side can tell which messages it missed and how late each one was.
+# Once everything is replayed the server keeps sending a filler line from FILLER_USER
+# every fillerInterval seconds, so runtime based loops such as write_chat() still end.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+import time
+import socket
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from processChat import read_records
+from chatMessage import parse_line
+
+
+
+FILLER_USER = 'faketwitch'
+
+
+
+def log_lines(logFile):
+    '''
+    The raw IRC PRIVMSG lines recorded in a #channel_chat.log.
+    '''
+    lines = []
+    for records, _ in read_records(logFile, includeTail=True):
+        for record in records:
+            _, _, text = record.strip().partition(' - ')
+            lines.extend(line for line in text.splitlines() if ' PRIVMSG #' in line)
+    return lines
+
+
+
+def readdress(line, channel):
+    '''
+    Returns line without tags and sent to channel instead of its own.
+    '''
+    if line.startswith('@'):
+        line = line.partition(' ')[2]
+    prefix, _, rest = line.partition(' PRIVMSG #')
+    _, _, message = rest.partition(' :')
+    return prefix + ' PRIVMSG ' + channel + ' :' + message
+
+
+
+class FakeTwitchServer:
+    def __init__(self, lines=None, logFile=None, rate=1000, burstSize=0, burstEvery=0,
+                 pingInterval=30, fillerInterval=0.5, host='127.0.0.1', port=0):
+        '''
+        - lines is a list of raw IRC PRIVMSG lines to replay, or logFile a log
+          to replay instead.
+
+        - rate is messages per second, burstSize extra messages are sent at
+          once every burstEvery seconds (0 for no bursts).
+
+        - port 0 picks a free port, read it from .port after start().
+        '''
+        self.lines = log_lines(logFile) if logFile is not None else list(lines or [])
+        self.rate = rate
+        self.burstSize = burstSize
+        self.burstEvery = burstEvery
+        self.pingInterval = pingInterval
+        self.fillerInterval = fillerInterval
+        self.host = host
+        self.port = port
+
+        self.clients = 0
+        self.sent = 0
+        self.pings = 0
+        self.pongs = 0
+        self.received = []
+        self.maxBacklog = 0
+        self.finished = threading.Event()
+
+        self._sock = None
+        self._running = False
+
+
+
+    def start(self):
+        '''
+        Starts listening, returns the server.
+        '''
+        self._sock = socket.socket()
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen()
+        self.port = self._sock.getsockname()[1]
+        self._running = True
+        threading.Thread(target=self._accept, name='FakeTwitch', daemon=True).start()
+        return self
+
+
+
+    def stop(self):
+        '''
+        Stops accepting and ends every client connection.
+        '''
+        self._running = False
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+
+
+    def _accept(self):
+        '''
+        Accept loop, one pair of threads per client.
+        '''
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            self.clients += 1
+            _Client(self, conn).start()
+
+
+
+class _Client:
+    def __init__(self, server, conn):
+        '''
+        One connected bot.
+        '''
+        self.server = server
+        self.conn = conn
+        self.nickname = 'justinfan'
+        self.tags = False
+        self.joined = threading.Event()
+        self.channel = None
+        self.closed = False
+        self._lock = threading.Lock()
+
+
+
+    def start(self):
+        '''
+        Starts the reader and the writer thread.
+        '''
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._write, daemon=True).start()
+
+
+
+    def _send(self, text):
+        '''
+        Sends text, marks the client closed when that fails.
+        '''
+        try:
+            with self._lock:
+                self.conn.sendall(text.encode('utf-8'))
+        except OSError:
+            self.closed = True
+
+
+
+    def _read(self):
+        '''
+        Handles the login and everything else the bot sends.
+        '''
+        buffer = b''
+        while not self.closed:
+            try:
+                chunk = self.conn.recv(4096)
+            except OSError:
+                chunk = b''
+            if len(chunk) == 0:
+                self.closed = True
+                break
+
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                self._handle(line.rstrip(b'\r').decode('utf-8', errors='replace'))
+
+        self.joined.set()
+
+
+
+    def _handle(self, line):
+        '''
+        Answers one line from the bot the way Twitch would.
+        '''
+        message = parse_line(line)
+        if message.command == 'CAP':
+            self.tags = 'twitch.tv/tags' in message.message
+            self._send(':tmi.twitch.tv CAP * ACK :' + message.message + '\r\n')
+        elif message.command == 'NICK':
+            self.nickname = line.split()[1]
+            self._send(f':tmi.twitch.tv 001 {self.nickname} :Welcome, GLHF!\r\n')
+        elif message.command == 'JOIN':
+            self.channel = line.split()[1].split(',')[0]
+            self._send(f':{self.nickname}!{self.nickname}@{self.nickname}.tmi.twitch.tv '
+                       f'JOIN {self.channel}\r\n')
+            self.joined.set()
+        elif message.command == 'PONG':
+            self.server.pongs += 1
+        elif message.command == 'PRIVMSG':
+            self.server.received.append(message.message)
+
+
+
+    def _line(self, sequence, line, due):
+        '''
+        Readdressed line, tagged with its sequence number and due time when the
+        client asked for tags.
+        '''
+        line = readdress(line, self.channel)
+        if self.tags == True:
+            line = '@id=%d;tmi-sent-ts=%d ' % (sequence, due * 1000) + line
+        return line + '\r\n'
+
+
+
+    def _write(self):
+        '''
+        Replays the chat on schedule, then sends filler until the bot leaves.
+        '''
+        server = self.server
+        self.joined.wait()
+        if self.closed:
+            return
+
+        lines = server.lines
+        start = time.time()
+        nextPing = start + server.pingInterval
+        sent = 0
+
+        while sent < len(lines) and not self.closed and server._running:
+            now = time.time()
+            elapsed = now - start
+            bursts = int(elapsed // server.burstEvery) if server.burstEvery > 0 else 0
+            due = min(len(lines), int(elapsed * server.rate) + bursts * server.burstSize)
+            server.maxBacklog = max(server.maxBacklog, due - sent)
+
+            if now >= nextPing:
+                self._send('PING :tmi.twitch.tv\r\n')
+                server.pings += 1
+                nextPing = now + server.pingInterval
+
+            if due > sent:
+                # Every line carries the time it was due, not when it was sent
+                self._send(''.join(self._line(i, lines[i], start + min(i / server.rate, elapsed))
+                                   for i in range(sent, due)))
+                server.sent += due - sent
+                sent = due
+            else:
+                time.sleep(0.001)
+
+        server.finished.set()
+
+        filler = f':{FILLER_USER}!{FILLER_USER}@{FILLER_USER}.tmi.twitch.tv PRIVMSG #x :filler'
+        while not self.closed and server._running:
+            if time.time() >= nextPing:
+                self._send('PING :tmi.twitch.tv\r\n')
+                server.pings += 1
+                nextPing = time.time() + server.pingInterval
+            self._send(self._line(-1, filler, time.time()))
+            time.sleep(server.fillerInterval)
+
+        try:
+            self.conn.close()
+        except OSError:
+            pass
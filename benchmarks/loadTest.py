@@ -0,0 +1,220 @@
+#########################################################################################
+#                              End to end load test                                     #
+#########################################################################################
+# Drives a real ChatBot against the local FakeTwitchServer and measures how many
+# messages write_chat, vote_counter and contest miss and how late they see them.
+#
+# The bot connects with IRCv3 tags so every replayed line carries its sequence number
+# and the time it was due.  read_messages() is wrapped to record each line the bot
+# reads, which gives per-message delay (received - due) and the missed sequence numbers.
+# For write_chat and vote_counter the log written is checked as well, vote_counter's
+# tally is compared with a tally of everything sent, and contest reports its Winners'
+# announcement latency.
+#
+#   Usage:  python benchmarks/loadTest.py [-m write_chat vote_counter contest]
+#                                         [-n records] [--rate 2000] [--burst 500 5]
+#                                         [--log #channel_chat.log] [-o loadTest.json]
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+from twitchChatBot import ChatBot, TWITCH_CAPABILITIES
+from chatMessage import parse_line
+from voteTally import VoteTally
+from processChat import read_records
+from syntheticChat import synthetic_lines
+from fakeTwitch import FakeTwitchServer, FILLER_USER
+
+
+
+VOTE_KEYS = ['Kappa', 'PogChamp', 'LUL']
+CONTEST_PHRASE = 'fake twitch winner'
+
+
+
+class _Recorder:
+    def __init__(self, bot):
+        '''
+        Wraps bot.read_messages to record the delay of every replayed line.
+        '''
+        self.delays = {}
+        self.duplicates = 0
+        self.first = None
+        self.last = None
+        read_messages = bot.read_messages
+
+        def recorded():
+            for message in read_messages():
+                sequence = message.tags.get('id') if message.tags else None
+                if sequence is not None and message.username != FILLER_USER:
+                    sequence = int(sequence)
+                    if sequence in self.delays:
+                        self.duplicates += 1
+                    self.delays[sequence] = message.received - message.serverTime
+                    self.first = message.received if self.first is None else self.first
+                    self.last = message.received
+                yield message
+
+        bot.read_messages = recorded
+
+
+
+    def summary(self, sent):
+        '''
+        Dictionary of received, missed and delay percentiles in milliseconds.
+        '''
+        delays = np.array(list(self.delays.values())) * 1000
+        span = (self.last - self.first) if self.first is not None else 0
+        return {'sent': sent, 'received': len(self.delays), 'missed': sent - len(self.delays),
+                'duplicates': self.duplicates,
+                'messagesPerSecond': len(self.delays) / span if span > 0 else None,
+                'delayMs': {name: float(np.percentile(delays, q)) if len(delays) else None
+                            for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))}}
+
+
+
+def logged_sequences(logFile):
+    '''
+    Sequence numbers of the replayed lines found in a log.
+    '''
+    found = set()
+    if not os.path.exists(logFile):
+        return found
+    for records, _ in read_records(logFile, includeTail=True):
+        for record in records:
+            message = parse_line(record.strip().partition(' - ')[2])
+            if message.tags and message.username != FILLER_USER:
+                found.add(int(message.tags['id']))
+    return found
+
+
+
+def contest_lines(lines, winners):
+    '''
+    lines with the contest phrase said by winners different users, spread
+    evenly through the replay.
+    '''
+    lines = list(lines)
+    step = len(lines) // (winners + 1)
+    for i in range(winners):
+        user = 'winner%d' % i
+        lines[step * (i + 1)] = (f':{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #x '
+                                 f':{CONTEST_PHRASE}')
+    return lines
+
+
+
+def run_mode(mode, lines, rate, burstSize=0, burstEvery=0, winners=5):
+    '''
+    Runs one ChatBot method against a fresh FakeTwitchServer replaying lines
+    and returns its results dictionary.
+    '''
+    if mode == 'contest':
+        lines = contest_lines(lines, winners)
+
+    server = FakeTwitchServer(lines, rate=rate, burstSize=burstSize, burstEvery=burstEvery,
+                              pingInterval=1).start()
+    duration = len(lines) / rate
+    runtime = duration + 2
+
+    bot = ChatBot('loadtest', '#loadtest', '127.0.0.1', server.port, 'oauth:loadtest')
+    bot.capabilities = TWITCH_CAPABILITIES
+    recorder = _Recorder(bot)
+    result = {'mode': mode}
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            bot.connect_socket()
+            timer = time.perf_counter()
+
+            with mock.patch('builtins.input', return_value=''):
+                if mode == 'write_chat':
+                    bot.write_chat(runtime, showProgress=False)
+                elif mode == 'vote_counter':
+                    with open('voteLibrary.txt', 'w', encoding='utf-8') as f:
+                        f.write(', '.join(VOTE_KEYS))
+                    votes = bot.vote_counter(runtime, 'voteLibrary.txt', showProgress=False)
+                    expected = VoteTally(VOTE_KEYS, uniqueUsers=True)
+                    for line in lines:
+                        expected.add_message(parse_line(line))
+                    result['votesCorrect'] = votes == expected.results()
+                elif mode == 'contest':
+                    found = bot.contest(CONTEST_PHRASE, showProgress=False, winners=winners)
+                    result['winners'] = len(found)
+                    result['expectedWinners'] = winners
+                    result['announceLatencyMs'] = [win.latency * 1000 for win in found]
+
+            result['seconds'] = time.perf_counter() - timer
+
+            if mode in ('write_chat', 'vote_counter'):
+                logged = logged_sequences(bot.logFile)
+                result['logged'] = len(logged)
+                result['missingFromLog'] = len(recorder.delays.keys() - logged)
+
+        finally:
+            try:
+                bot.sock.close()
+            except OSError:
+                pass
+            bot.sendQueue.stop()
+            server.stop()
+            os.chdir(cwd)
+
+    # The contest stops reading once every winner is found, count up to the last line read
+    sent = server.sent
+    if mode == 'contest':
+        sent = max(recorder.delays) + 1 if recorder.delays else 0
+    result.update(recorder.summary(sent))
+    result.update({'serverMaxBacklog': server.maxBacklog, 'pings': server.pings,
+                   'pongs': server.pongs})
+    return result
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test ChatBot against a fake Twitch.')
+    parser.add_argument('-m', '--modes', nargs='+', default=['write_chat', 'vote_counter',
+                                                             'contest'])
+    parser.add_argument('-n', '--records', type=int, default=50000)
+    parser.add_argument('--rate', type=float, default=5000, help='messages per second')
+    parser.add_argument('--burst', type=float, nargs=2, default=[0, 0],
+                        metavar=('SIZE', 'EVERY'), help='burst size every seconds')
+    parser.add_argument('--log', help='replay this #channel_chat.log instead of synthetic chat')
+    parser.add_argument('--unicode', type=float, default=0.2)
+    parser.add_argument('--emoji', type=float, default=0.1)
+    parser.add_argument('-o', '--out', default='loadTest.json')
+    args = parser.parse_args()
+
+    if args.log:
+        lines = FakeTwitchServer(logFile=args.log).lines
+    else:
+        lines = [line for _, line in synthetic_lines(args.records, unicodeRate=args.unicode,
+                                                      emojiRate=args.emoji)]
+
+    results = []
+    for mode in args.modes:
+        result = run_mode(mode, lines, args.rate, int(args.burst[0]), args.burst[1])
+        results.append(result)
+        delay = result['delayMs']
+        print('\n%-12s: %d sent, %d received, %d missed, delay p50 %.1f ms  p99 %.1f ms  '
+              'max %.1f ms' % (mode, result['sent'], result['received'], result['missed'],
+                               delay['p50'] or 0, delay['p99'] or 0, delay['max'] or 0))
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({'time': time.strftime('%Y-%m-%d_%H:%M:%S'), 'rate': args.rate,
+                   'burst': args.burst, 'records': len(lines), 'results': results}, f, indent=2)
+    print('\nResults saved to ' + args.out + '\n')
@@ -0,0 +1,91 @@
+#########################################################################################
+#                             Synthetic chat generator                                  #
+#########################################################################################
+# Reproducible fake Twitch chat for the benchmarks.
+#
+#   synthetic_lines : Generator of raw IRC PRIVMSG lines, as the bot receives them.
+#
+#   write_synthetic_log : Writes the same lines to a #channel_chat.log in the
+#                         write_chat record format.
+#
+# The mix is configurable: number of records, channels and users, the share of
+# messages with accented characters (unicodeRate) or emoji (emojiRate), and whether
+# lines carry IRCv3 tags with user ids, server timestamps and emote ranges.  A seed
+# makes every run produce the same chat.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import random
+from datetime import datetime, timedelta
+
+
+
+WORDS = ['pog', 'lul', 'kappa', 'hello', 'gg', 'wp', 'no', 'yes', 'chat', 'hype']
+EMOTES = ['Kappa', 'PogChamp', 'LUL', 'Kreygasm', 'BibleThump']
+ACCENTED = ['\u00e9', '\u00fc', '\u00f1', '\u00e7', '\u2764']
+EMOJI = ['\U0001F600', '\U0001F525', '\U0001F44D', '\U0001F602', '\u2764\ufe0f']
+
+# Messages per second of synthetic time
+MESSAGE_RATE = 20
+
+
+
+def synthetic_lines(records, channel='benchmark', channels=1, users=5000, unicodeRate=0.0,
+                    emojiRate=0.0, emoteRate=0.1, tags=False, seed=0):
+    '''
+    Generator of (stamp, line) for records chat messages, stamp is a datetime.
+
+    - With channels > 1 the channels are named channel0, channel1 ...
+
+    - emoteRate is the share of words that are Twitch emotes, tags adds the
+      IRCv3 tags Twitch sends with the twitch.tv/tags capability.
+    '''
+    rand = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    names = [channel] if channels == 1 else ['%s%d' % (channel, i) for i in range(channels)]
+
+    for i in range(records):
+        stamp = start + timedelta(seconds=i // MESSAGE_RATE)
+        userId = rand.randrange(users)
+        user = 'user%d' % userId
+
+        words = [rand.choice(EMOTES) if rand.random() < emoteRate else rand.choice(WORDS)
+                 for _ in range(rand.randint(1, 12))]
+        if rand.random() < unicodeRate:
+            words.append(rand.choice(ACCENTED))
+        if rand.random() < emojiRate:
+            words.append(rand.choice(EMOJI))
+        message = ' '.join(words)
+
+        line = f':{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{rand.choice(names)} :{message}'
+
+        if tags == True:
+            emotes = {}
+            position = 0
+            for word in words:
+                if word in EMOTES:
+                    emotes.setdefault(EMOTES.index(word), []).append(
+                        '%d-%d' % (position, position + len(word) - 1))
+                position += len(word) + 1
+            emotes = '/'.join('%d:%s' % (25 + index, ','.join(spans))
+                              for index, spans in emotes.items())
+            sent = int((stamp - datetime(1970, 1, 1)).total_seconds() * 1000) + i % MESSAGE_RATE
+            line = (f'@badge-info=;badges=;display-name={user};emotes={emotes};'
+                    f'tmi-sent-ts={sent};user-id={1000 + userId} ' + line)
+
+        yield stamp, line
+
+
+
+def write_synthetic_log(logFile, records, channel='benchmark', unicodeRate=0.0, **options):
+    '''
+    Writes records chat lines in the write_chat record format, unicodeRate of
+    them containing a non-ASCII character.  options are passed on to
+    synthetic_lines().
+    '''
+    with open(logFile, 'w', encoding='utf-8') as f:
+        for stamp, line in synthetic_lines(records, channel, unicodeRate=unicodeRate, **options):
+            f.write(stamp.strftime('%Y-%m-%d_%H:%M:%S') + ' - ' + line + '\n\n\n')
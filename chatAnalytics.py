@@ -0,0 +1,376 @@
+#########################################################################################
+#                              Live chat analytics                                      #
+#########################################################################################
+# Sliding window statistics kept up to date as each message arrives, so message rates,
+# active chatters and what chat is spamming can be watched live instead of reloading
+# the whole log into a dataframe afterwards.
+#
+# Every channel keeps a ring of buckets covering the last window seconds.  Adding a
+# message only touches the current bucket and old buckets are cleared as time moves
+# on, so the work per message is constant and memory is fixed by the window and the
+# sketch sizes, never by how much chat goes by.
+#
+#   HyperLogLog : Approximate distinct counter, counts unique chatters per bucket.
+#
+#   HeavyHitters : Misra-Gries summary keeping the most frequent items in capacity
+#                  counters, used for top words and top emotes per bucket.
+#
+#   ChannelActivity : Ring buckets for one channel, rate(), chatters(), top_words(),
+#                     top_emotes() over the window and spike detection.
+#
+#   ChatAnalytics : handle(message) for every channel, usable as a ChatDispatcher or
+#                   ChatEngine handler or as write_chat's onMessage.  onSpike is called
+#                   when a channel's message rate jumps well above its recent baseline.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import time
+import threading
+import numpy as np
+
+
+
+class HyperLogLog:
+    def __init__(self, precision=8):
+        '''
+        2**precision one byte registers, the standard error is about
+        1.04 / sqrt(2**precision), 6.5% for the default.
+        '''
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._shift = 64 - precision
+        self._mask = (1 << self._shift) - 1
+
+
+
+    def add(self, item):
+        '''
+        Adds one hashable item.
+        '''
+        value = hash(item) & 0xFFFFFFFFFFFFFFFF
+        index = value >> self._shift
+        rank = self._shift - (value & self._mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+
+
+    def clear(self):
+        '''
+        Forgets every item.
+        '''
+        self.registers[:] = bytes(len(self.registers))
+
+
+
+    @staticmethod
+    def estimate(registers):
+        '''
+        Distinct count estimate from registers, used directly on the
+        element-wise maximum of several sketches to count their union.
+        '''
+        registers = np.frombuffer(registers, dtype=np.uint8)
+        size = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+
+        zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * size and zeros > 0:
+            # Linear counting is more accurate for small counts
+            estimate = size * np.log(size / zeros)
+        return int(round(estimate))
+
+
+
+    def count(self):
+        '''
+        Approximate number of distinct items added.
+        '''
+        return self.estimate(self.registers)
+
+
+
+class HeavyHitters:
+    def __init__(self, capacity=64):
+        '''
+        Misra-Gries summary with at most capacity counters.  Any item seen
+        more than n / (capacity + 1) times out of n is guaranteed to be kept,
+        its count is low by at most that much.
+        '''
+        self.capacity = capacity
+        self.counts = {}
+
+
+
+    def add(self, item, count=1):
+        '''
+        Counts one item, amortized constant time.
+        '''
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+        else:
+            # Decrement everything, each decrement pays for an earlier increment
+            for key in list(counts):
+                counts[key] -= 1
+                if counts[key] <= 0:
+                    del counts[key]
+
+
+
+    def clear(self):
+        '''
+        Forgets every item.
+        '''
+        self.counts.clear()
+
+
+
+class ChannelActivity:
+    def __init__(self, channel, window=60, bucketSize=1, topCapacity=64, precision=8,
+                 spikeFactor=3.0, spikeMinimum=10, baselineWeight=0.05):
+        '''
+        - window is the seconds covered, split into buckets of bucketSize seconds.
+
+        - topCapacity and precision size the per-bucket HeavyHitters and
+          HyperLogLog sketches.
+
+        - A spike is a bucket with at least spikeMinimum messages and spikeFactor
+          times the baseline, a moving average of earlier buckets weighted by
+          baselineWeight.
+        '''
+        self.channel = channel
+        self.window = window
+        self.bucketSize = bucketSize
+        self.spikeFactor = spikeFactor
+        self.spikeMinimum = spikeMinimum
+        self.baselineWeight = baselineWeight
+
+        size = max(1, int(round(window / bucketSize)))
+        self.counts = [0] * size
+        self.chattersSketch = [HyperLogLog(precision) for _ in range(size)]
+        self.words = [HeavyHitters(topCapacity) for _ in range(size)]
+        self.emotes = [HeavyHitters(topCapacity) for _ in range(size)]
+
+        self.total = 0
+        self.messages = 0
+        self.baseline = None
+        self.spikes = 0
+        self._bucket = None
+
+
+
+    def advance(self, stamp):
+        '''
+        Moves the window forward to stamp without adding a message, so a quiet
+        channel's statistics age out.  Returns a spike as add() does.
+        '''
+        return self._advance(int(stamp // self.bucketSize))
+
+
+
+    def _advance(self, bucket):
+        '''
+        Moves the ring forward to bucket, clearing the buckets that left the
+        window.  Returns the spike found in the bucket just closed, or None.
+        '''
+        if self._bucket is None:
+            self._bucket = bucket
+            return None
+        if bucket <= self._bucket:
+            return None
+
+        spike = self._close(self.counts[self._bucket % len(self.counts)])
+
+        for index in range(self._bucket + 1, min(bucket, self._bucket + len(self.counts)) + 1):
+            slot = index % len(self.counts)
+            self.total -= self.counts[slot]
+            self.counts[slot] = 0
+            self.chattersSketch[slot].clear()
+            self.words[slot].clear()
+            self.emotes[slot].clear()
+
+        # Buckets skipped without any chat count towards the baseline as quiet ones
+        for _ in range(min(bucket - self._bucket - 1, len(self.counts))):
+            self._close(0)
+
+        self._bucket = bucket
+        return spike
+
+
+
+    def _close(self, count):
+        '''
+        Checks a finished bucket's count against the baseline, then updates it.
+        '''
+        spike = None
+        if self.baseline is None:
+            self.baseline = float(count)
+            return None
+
+        if count >= self.spikeMinimum and count >= self.spikeFactor * max(self.baseline, 1.0):
+            self.spikes += 1
+            spike = {'channel': self.channel, 'time': self._bucket * self.bucketSize,
+                     'rate': count / self.bucketSize,
+                     'baseline': self.baseline / self.bucketSize}
+
+        self.baseline += self.baselineWeight * (count - self.baseline)
+        return spike
+
+
+
+    def add(self, message, stamp):
+        '''
+        Adds one ChatMessage received at stamp (epoch seconds).  Returns a spike
+        dictionary when this message closed a spiking bucket, else None.
+        '''
+        spike = self._advance(int(stamp // self.bucketSize))
+        slot = self._bucket % len(self.counts)
+
+        self.counts[slot] += 1
+        self.total += 1
+        self.messages += 1
+
+        self.chattersSketch[slot].add(message.username if message.userId is None
+                                      else message.userId)
+
+        words = self.words[slot]
+        for word in message.message.split():
+            words.add(word)
+
+        emotes = self.emotes[slot]
+        for name in message.emote_names():
+            emotes.add(name)
+
+        return spike
+
+
+
+    def rate(self):
+        '''
+        Messages per second over the window.
+        '''
+        return self.total / (len(self.counts) * self.bucketSize)
+
+
+
+    def chatters(self):
+        '''
+        Approximate number of distinct chatters in the window.
+        '''
+        registers = np.maximum.reduce([np.frombuffer(sketch.registers, dtype=np.uint8)
+                                       for sketch in self.chattersSketch])
+        return HyperLogLog.estimate(registers)
+
+
+
+    @staticmethod
+    def _top(summaries, n):
+        '''
+        Merges per-bucket HeavyHitters and returns the n largest (item, count).
+        '''
+        merged = {}
+        for summary in summaries:
+            for item, count in summary.counts.items():
+                merged[item] = merged.get(item, 0) + count
+        return sorted(merged.items(), key=lambda pair: pair[1], reverse=True)[:n]
+
+
+
+    def top_words(self, n=10):
+        '''
+        Most frequent words in the window as (word, approximate count).
+        '''
+        return self._top(self.words, n)
+
+
+
+    def top_emotes(self, n=10):
+        '''
+        Most frequent emotes in the window, only available with IRCv3 tags.
+        '''
+        return self._top(self.emotes, n)
+
+
+
+    def snapshot(self, n=10):
+        '''
+        Dictionary of the current window statistics.
+        '''
+        return {'channel': self.channel, 'messages': self.messages, 'window': self.total,
+                'rate': self.rate(), 'chatters': self.chatters(),
+                'topWords': self.top_words(n), 'topEmotes': self.top_emotes(n),
+                'baseline': None if self.baseline is None else self.baseline / self.bucketSize,
+                'spikes': self.spikes}
+
+
+
+def report_spike(spike):
+    '''
+    Default onSpike, prints the spike.
+    '''
+    print('\n\nHype spike in #%s :  %.1f messages/s (usually %.1f)'
+          % (spike['channel'], spike['rate'], spike['baseline']))
+
+
+
+class ChatAnalytics:
+    def __init__(self, onSpike=report_spike, **activity):
+        '''
+        Live analytics for every channel seen.  onSpike(spike) is called for
+        each spike, activity is passed on to every ChannelActivity.
+        '''
+        self.name = 'analytics'
+        self.onSpike = onSpike
+        self.activity = activity
+        self.channels = {}
+        self._lock = threading.Lock()
+
+
+
+    def handle(self, message):
+        '''
+        Adds one ChatMessage, anything other than PRIVMSG is ignored.
+        '''
+        if message.command != 'PRIVMSG' or message.channel is None:
+            return
+
+        stamp = message.serverTime
+        if stamp is None:
+            stamp = message.received if message.received is not None else time.time()
+
+        with self._lock:
+            channel = self.channels.get(message.channel)
+            if channel is None:
+                channel = ChannelActivity(message.channel, **self.activity)
+                self.channels[message.channel] = channel
+            spike = channel.add(message, stamp)
+
+        if spike is not None and self.onSpike is not None:
+            self.onSpike(spike)
+
+
+
+    __call__ = handle
+
+
+
+    def snapshot(self, n=10, now=None):
+        '''
+        Dictionary of channel to its ChannelActivity.snapshot(), every channel
+        is first moved forward to now (default the current time).
+        '''
+        now = time.time() if now is None else now
+        with self._lock:
+            spikes = [channel.advance(now) for channel in self.channels.values()]
+            snapshot = {name: channel.snapshot(n) for name, channel in self.channels.items()}
+
+        for spike in spikes:
+            if spike is not None and self.onSpike is not None:
+                self.onSpike(spike)
+        return snapshot
@@ -0,0 +1,302 @@
+#########################################################################################
+#                              Columnar chat archive                                    #
+#########################################################################################
+# Compact alternative to the #channel_chat.log text format.
+#
+# An archive is a directory of append-only segments, each holding up to segmentSize
+# chat messages stored by column:
+#
+#     dt.npy        int64 timestamps, local wall clock seconds like the text logs
+#     channel.npy   int32 codes into the segment's channel list
+#     username.npy  int32 codes into the segment's username list
+#     message.z     zlib compressed messages, one per line
+#     strings.json  the channel and username lists
+#
+# The numeric columns are left uncompressed so they can be memory-mapped.  index.json
+# records the rows, min/max timestamp and channels of every segment so a query only
+# opens the segments that can match.
+#
+#   ChatArchive : append() messages, flush() segments, read() a time/channel range.
+#
+# While logging live chat call start() first.  Segments are then compressed and written
+# by a background thread so append() never waits on disk, and buffered messages are
+# also written as a segment once the oldest has waited flushInterval seconds, so a
+# crash loses at most that much of the archive.  close() writes the rest and stops the
+# thread.
+#
+#   convert_log : Converts an existing #channel_chat.log into an archive.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import json
+import zlib
+import time
+import queue
+import threading
+import numpy as np
+import pandas as pd
+from processChat import iter_chat_records, DT_DTYPE
+from chatMessage import local_seconds
+
+
+
+def to_seconds(value):
+    '''
+    Converts a datetime, Timestamp or date string to archive seconds.
+    '''
+    return pd.Timestamp(value).value // 10**9
+
+
+
+class ChatArchive:
+    def __init__(self, directory, segmentSize=100000, level=6, flushInterval=60):
+        '''
+        Opens or creates the archive in directory.  level is the zlib level
+        used for the message column.  flushInterval is the most seconds a
+        message waits for its segment once start() has been called.
+        '''
+        self.directory = directory
+        self.segmentSize = segmentSize
+        self.level = level
+        self.flushInterval = flushInterval
+
+        os.makedirs(directory, exist_ok=True)
+        self.indexFile = os.path.join(directory, 'index.json')
+
+        self.index = []
+        if os.path.exists(self.indexFile):
+            with open(self.indexFile, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+        self._rows = ([], [], [], [])
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+
+
+    def start(self):
+        '''
+        Starts the segment writer thread.
+        '''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='ChatArchive ' + self.directory)
+            self._thread.start()
+        return self
+
+
+
+    def append(self, stamp, channel, username, message):
+        '''
+        Adds one message, stamp is epoch seconds as returned by time.time().
+        A segment is written every segmentSize messages.
+        '''
+        self.append_local(local_seconds(stamp), channel, username, message)
+
+
+
+    def append_local(self, seconds, channel, username, message):
+        '''
+        Adds one message stamped in local wall clock seconds.
+        '''
+        with self._lock:
+            dt, channels, usernames, messages = self._rows
+            if not dt:
+                self._oldest = time.monotonic()
+            dt.append(int(seconds))
+            channels.append(channel)
+            usernames.append(username)
+            messages.append(message.replace('\n', ' '))
+            full = len(dt) >= self.segmentSize
+
+        if full == True:
+            self.flush()
+
+
+
+    def append_dataframe(self, chat):
+        '''
+        Adds every row of a dt/channel/username/message dataframe.
+        '''
+        seconds = chat['dt'].values.astype('datetime64[s]').astype(np.int64)
+        for row in zip(seconds, chat['channel'], chat['username'], chat['message']):
+            self.append_local(*row)
+
+
+
+    def flush(self):
+        '''
+        Writes buffered messages as a new segment and updates the index, or
+        hands them to the writer thread when it is running.
+        '''
+        with self._lock:
+            rows = self._rows
+            self._rows = ([], [], [], [])
+        if len(rows[0]) == 0:
+            return
+
+        if self._thread is not None:
+            self._queue.put(rows)
+        else:
+            self._write_segment(rows)
+
+
+
+    def _write_segment(self, rows):
+        '''
+        Writes rows as a new segment and updates the index.
+        '''
+        dt, channels, usernames, messages = rows
+
+        name = 'segment-%06d' % len(self.index)
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+
+        channelCodes, channelList = pd.factorize(pd.Series(channels, dtype=object))
+        userCodes, userList = pd.factorize(pd.Series(usernames, dtype=object))
+
+        np.save(os.path.join(path, 'dt.npy'), np.asarray(dt, dtype=np.int64))
+        np.save(os.path.join(path, 'channel.npy'), channelCodes.astype(np.int32))
+        np.save(os.path.join(path, 'username.npy'), userCodes.astype(np.int32))
+
+        with open(os.path.join(path, 'message.z'), 'wb') as f:
+            f.write(zlib.compress('\n'.join(messages).encode('utf-8'), self.level))
+
+        with open(os.path.join(path, 'strings.json'), 'w', encoding='utf-8') as f:
+            json.dump({'channel': list(channelList), 'username': list(userList)}, f)
+
+        self.index.append({'name': name, 'rows': len(dt), 'start': min(dt), 'end': max(dt),
+                           'channels': sorted(set(channelList))})
+
+        # Replace the index in one step so readers never see a partial file
+        with open(self.indexFile + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(self.indexFile + '.tmp', self.indexFile)
+
+
+
+    def close(self):
+        '''
+        Flushes any buffered messages and stops the writer thread once every
+        segment is written.
+        '''
+        self.flush()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+
+    def _run(self):
+        '''
+        Writer thread, writes the segments flush() hands over and flushes
+        messages that have waited flushInterval seconds.
+        '''
+        while True:
+            due = None
+            if self._rows[0]:
+                due = self._oldest + self.flushInterval
+            try:
+                rows = self._queue.get(timeout=self.flushInterval if due is None
+                                       else max(due - time.monotonic(), 0))
+            except queue.Empty:
+                if due is not None and time.monotonic() >= due:
+                    self.flush()
+                continue
+
+            if rows is None:
+                return
+            self._write_segment(rows)
+
+
+
+    def segments(self, start=None, end=None, channels=None):
+        '''
+        Index entries of the segments that may hold messages in the range.
+        '''
+        start = None if start is None else to_seconds(start)
+        end = None if end is None else to_seconds(end)
+        channels = None if channels is None else {channel.lstrip('#') for channel in channels}
+
+        found = []
+        for segment in self.index:
+            if start is not None and segment['end'] < start:
+                continue
+            if end is not None and segment['start'] > end:
+                continue
+            if channels is not None and channels.isdisjoint(segment['channels']):
+                continue
+            found.append(segment)
+
+        return found
+
+
+
+    def read(self, start=None, end=None, channels=None):
+        '''
+        Returns a dt/channel/username/message dataframe of the messages sent
+        between start and end (inclusive) in the given channels.  Only the
+        segments listed in the index for that range are opened.
+        '''
+        startSeconds = None if start is None else to_seconds(start)
+        endSeconds = None if end is None else to_seconds(end)
+        wanted = None if channels is None else {channel.lstrip('#') for channel in channels}
+
+        frames = []
+        for segment in self.segments(start, end, channels):
+            path = os.path.join(self.directory, segment['name'])
+            dt = np.load(os.path.join(path, 'dt.npy'), mmap_mode='r')
+            channelCodes = np.load(os.path.join(path, 'channel.npy'), mmap_mode='r')
+            userCodes = np.load(os.path.join(path, 'username.npy'), mmap_mode='r')
+
+            with open(os.path.join(path, 'strings.json'), 'r', encoding='utf-8') as f:
+                strings = json.load(f)
+            channelList = np.array(strings['channel'], dtype=object)
+            userList = np.array(strings['username'], dtype=object)
+
+            mask = np.ones(len(dt), dtype=bool)
+            if startSeconds is not None:
+                mask &= dt >= startSeconds
+            if endSeconds is not None:
+                mask &= dt <= endSeconds
+            if wanted is not None:
+                mask &= np.isin(channelCodes, [i for i, channel in enumerate(strings['channel'])
+                                               if channel in wanted])
+            if not mask.any():
+                continue
+
+            with open(os.path.join(path, 'message.z'), 'rb') as f:
+                messages = zlib.decompress(f.read()).decode('utf-8').split('\n')
+
+            frames.append(pd.DataFrame({
+                'dt': pd.to_datetime(dt[mask], unit='s').astype(DT_DTYPE),
+                'channel': channelList[channelCodes[mask]],
+                'username': userList[userCodes[mask]],
+                'message': np.array(messages, dtype=object)[mask],
+                }))
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=['dt', 'channel', 'username', 'message'])
+
+        return pd.concat(frames, ignore_index=True)
+
+
+
+def convert_log(logFile, directory, segmentSize=100000):
+    '''
+    Appends every message of a #channel_chat.log to the archive in directory
+    and returns the ChatArchive.
+    '''
+    archive = ChatArchive(directory, segmentSize)
+    for record in iter_chat_records(logFile):
+        archive.append_local(*record)
+    archive.close()
+
+    return archive
@@ -0,0 +1,395 @@
+#########################################################################################
+#                               Command line interface                                  #
+#########################################################################################
+# Scriptable front end for the bot, runBot.py stays the interactive version.
+#
+#   Usage:  python chatCli.py [--config bot.ini] <command> [options]
+#
+#   Commands:  - read : Print live chat.
+#              - log : Log chat to #channel_chat.log (and optionally a ChatArchive)
+#                      for --runtime seconds, or until stopped.
+#              - vote : Log chat and tally votes for the keys in --library.
+#              - contest : Find winners for one or more phrases.
+#              - process : Work on an existing log offline, no connection needed.
+#              - search : Find messages by word, phrase, user and time in a ChatIndex.
+#
+# Connection settings (--nickname, --channel, --token, --server, --port, --tags) can
+# come from the [bot] section of an INI config file and any command option from a
+# section named after the command.  [bot] is only used by the commands that connect,
+# process and search ignore it.  Options given on the command line win, and the token
+# can also be set in the TWITCH_OAUTH_TOKEN environment variable.  --config can be
+# given before or after the command.
+#
+#   [bot]                          [log]
+#   nickname = mybot               runtime = 3600
+#   channel = #channel             archive = archive
+#   token = oauth:...
+#
+# Only what a command uses is imported: logging never loads pandas or numpy, emoji is
+# loaded on the first non-ASCII message and progressbar only when a bar is shown.
+#
+# --daemon detaches from the terminal (POSIX only) writing output to --output and the
+# process id to --pidfile.  SIGTERM stops logging cleanly, every queued record is
+# written before the process exits.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+import signal
+import argparse
+import configparser
+
+
+
+def _add_connection(parser):
+    '''
+    Options shared by every command that connects to Twitch.
+    '''
+    parser.add_argument('--nickname')
+    parser.add_argument('--channel', help='channel in the form #channelname')
+    parser.add_argument('--token', help='OAuth token, or set TWITCH_OAUTH_TOKEN')
+    parser.add_argument('--server', default='irc.chat.twitch.tv')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--tags', action='store_true',
+                        help='request IRCv3 tags (user ids, server times, emotes)')
+    parser.add_argument('--show', action='store_true', help='print chat while running')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve Prometheus metrics on this local port')
+    parser.add_argument('--daemon', action='store_true', help='run in the background')
+    parser.add_argument('--pidfile')
+    parser.add_argument('--output', help='file for output when running as a daemon')
+
+
+
+def build_parser():
+    '''
+    Returns the argument parser and a dictionary of command name to subparser.
+    '''
+    parser = argparse.ArgumentParser(description='Twitch chat bot.')
+    parser.add_argument('--config', help='INI file with [bot] and per command sections')
+    commands = parser.add_subparsers(dest='command', required=True)
+    subparsers = {}
+
+    read = subparsers['read'] = commands.add_parser('read', help='print live chat')
+    _add_connection(read)
+
+    log = subparsers['log'] = commands.add_parser('log', help='log chat to a file')
+    _add_connection(log)
+    log.add_argument('--runtime', type=float, help='seconds to log, default until stopped')
+    log.add_argument('--archive', help='also store chat in this ChatArchive directory')
+    log.add_argument('--archive-flush', type=float, default=60, metavar='SECONDS',
+                     help='most seconds a message waits before it is archived')
+    log.add_argument('--index', help='keep this ChatIndex file up to date while logging')
+    log.add_argument('--dedup', type=float, metavar='SECONDS',
+                     help='log repeated messages within this window as counts')
+
+    vote = subparsers['vote'] = commands.add_parser('vote', help='log chat and tally votes')
+    _add_connection(vote)
+    vote.add_argument('--runtime', type=float, help='seconds to count, default until stopped')
+    vote.add_argument('--library', default='voteLibrary.txt')
+    vote.add_argument('--all-votes', action='store_true',
+                      help='count every vote instead of one per user')
+    vote.add_argument('--spam-window', type=float, metavar='SECONDS',
+                      help='ignore a user repeating a message within this window')
+    vote.add_argument('--stop-at', type=int, metavar='VOTES',
+                      help='stop once a key has this many votes')
+    vote.add_argument('--history', type=float, metavar='SECONDS',
+                      help='keep the votes per key in intervals of this length')
+    vote.add_argument('--snapshot-every', type=float, metavar='SECONDS',
+                      help='show the live leaderboard this often')
+    vote.add_argument('--snapshot-file', help='write each leaderboard snapshot to this JSON file')
+
+    contest = subparsers['contest'] = commands.add_parser('contest', help='run a contest')
+    _add_connection(contest)
+    contest.add_argument('phrases', nargs='+')
+    contest.add_argument('--winners', type=int, default=1)
+    contest.add_argument('--ignore-case', action='store_true')
+    contest.add_argument('--whole-word', action='store_true')
+
+    process = subparsers['process'] = commands.add_parser('process',
+                                                          help='process an existing log')
+    process.add_argument('log')
+    process.add_argument('--clean', help='write cleaned messages to this file')
+    process.add_argument('--users', action='store_true', help='keep usernames when cleaning')
+    process.add_argument('--vocab', type=int, help='show this many of the most used words')
+    process.add_argument('--archive', help='convert the log into this ChatArchive directory')
+    process.add_argument('--processes', type=int, help='worker processes for cleaning')
+    process.add_argument('--incremental', action='store_true',
+                         help='only read what was appended since the last run')
+    process.add_argument('--index', help='add the log to this ChatIndex file')
+
+    search = subparsers['search'] = commands.add_parser('search', help='search a ChatIndex')
+    search.add_argument('index')
+    search.add_argument('words', nargs='*', help='messages must contain every word')
+    search.add_argument('--user')
+    search.add_argument('--phrase', help='words that must appear together in this order')
+    search.add_argument('--start', help='date or time, e.g. 2020-05-01 or "2020-05-01 18:00"')
+    search.add_argument('--end')
+    search.add_argument('--channel', action='append', help='may be given several times')
+    search.add_argument('--limit', type=int, default=50)
+    search.add_argument('--timeline', action='store_true',
+                        help='count matches per time bucket instead of listing them')
+
+    # --config is read before the full parse, accept it after the command as well
+    for sub in subparsers.values():
+        sub.add_argument('--config', default=argparse.SUPPRESS, help=argparse.SUPPRESS)
+
+    return parser, subparsers
+
+
+
+def apply_config(configFile, parser, subparsers, argv):
+    '''
+    Sets option defaults from the [bot] section and the command's section of
+    configFile, so anything given on the command line still wins.
+    '''
+    config = configparser.ConfigParser()
+    if not config.read(configFile, encoding='utf-8'):
+        parser.error('config file not found: ' + configFile)
+
+    command = next((arg for arg in argv if arg in subparsers), None)
+    if command is None:
+        return
+
+    sub = subparsers[command]
+    actions = {action.dest: action for action in sub._actions}
+    defaults = {}
+    for section in ('bot', command):
+        if not config.has_section(section):
+            continue
+        # Connection settings only apply to commands that connect
+        if section == 'bot' and 'nickname' not in actions:
+            continue
+        for key in config[section]:
+            dest = key.replace('-', '_')
+            if dest not in actions:
+                parser.error('unknown option in [%s]: %s' % (section, key))
+            if isinstance(actions[dest], argparse._StoreTrueAction):
+                defaults[dest] = config.getboolean(section, key)
+            else:
+                # String defaults go through the option's type like command line values
+                defaults[dest] = config.get(section, key)
+    sub.set_defaults(**defaults)
+
+
+
+def daemonize(pidfile=None, output=None):
+    '''
+    Detaches the process from the terminal with the usual double fork.
+    '''
+    if not hasattr(os, 'fork'):
+        sys.exit('--daemon needs a POSIX system, run the bot under a service manager instead')
+
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(os.devnull, 'rb') as devnull:
+        os.dup2(devnull.fileno(), sys.stdin.fileno())
+    with open(output or os.devnull, 'ab') as out:
+        os.dup2(out.fileno(), sys.stdout.fileno())
+        os.dup2(out.fileno(), sys.stderr.fileno())
+
+    if pidfile is not None:
+        with open(pidfile, 'w') as f:
+            f.write('%d\n' % os.getpid())
+
+
+
+def _stop(signum, frame):
+    '''
+    SIGTERM handler, stops the running command the same way Ctrl-C does.
+    '''
+    raise KeyboardInterrupt
+
+
+
+def connect(args):
+    '''
+    Returns a connected ChatBot for the connection options in args.
+    '''
+    from twitchChatBot import ChatBot, TWITCH_CAPABILITIES
+
+    token = args.token or os.environ.get('TWITCH_OAUTH_TOKEN')
+    if not args.nickname or not args.channel or not token:
+        sys.exit('nickname, channel and token are required (options, config file or '
+                 'TWITCH_OAUTH_TOKEN)')
+    channel = args.channel if args.channel.startswith('#') else '#' + args.channel
+
+    bot = ChatBot(args.nickname, channel, args.server, args.port, token)
+    if args.tags == True:
+        bot.capabilities = TWITCH_CAPABILITIES
+    if args.metrics_port is not None:
+        bot.metrics.serve(args.metrics_port)
+    bot.connect_socket()
+    return bot
+
+
+
+def run_command(args):
+    '''
+    Runs the parsed command.
+    '''
+    if args.command == 'process':
+        return process(args)
+    if args.command == 'search':
+        return search(args)
+
+    if args.daemon == True:
+        daemonize(args.pidfile, args.output)
+    signal.signal(signal.SIGTERM, _stop)
+
+    bot = connect(args)
+    # A progress bar only makes sense on a terminal
+    showProgress = args.show == False and sys.stdout.isatty()
+
+    if args.command == 'read':
+        bot.read_chat()
+
+    elif args.command == 'log':
+        archive = None
+        if args.archive is not None:
+            from chatArchive import ChatArchive
+            archive = ChatArchive(args.archive, flushInterval=args.archive_flush)
+        index = None
+        if args.index is not None:
+            from chatIndex import ChatIndex
+            index = ChatIndex(args.index)
+        dedup = None
+        if args.dedup is not None:
+            from chatDedup import DuplicateFilter
+            dedup = DuplicateFilter(args.dedup)
+        bot.write_chat(args.runtime, showProgress, args.show, archive=archive, prompt=False,
+                       index=index, dedup=dedup)
+
+    elif args.command == 'vote':
+        dedup = None
+        if args.spam_window is not None:
+            from chatDedup import DuplicateFilter
+            dedup = DuplicateFilter(args.spam_window)
+        onSnapshot = None
+        if args.snapshot_every is not None and args.snapshot_file is None:
+            onSnapshot = print_leaderboard
+            showProgress = False
+        talliedVotes = bot.vote_counter(args.runtime, args.library, showProgress, args.show,
+                                        not args.all_votes, prompt=False, dedup=dedup,
+                                        threshold=args.stop_at, bucketSeconds=args.history,
+                                        snapshotInterval=args.snapshot_every,
+                                        onSnapshot=onSnapshot, snapshotFile=args.snapshot_file)
+        for key in talliedVotes:
+            print(key + ' :  %d' % talliedVotes[key])
+
+    elif args.command == 'contest':
+        found = bot.contest(args.phrases, showProgress, args.show, args.winners,
+                            args.ignore_case, args.whole_word)
+        if len(found) == 0:
+            print('\nNo winner found')
+
+
+
+def print_leaderboard(snapshot):
+    '''
+    Prints a leaderboard snapshot on one line.
+    '''
+    standings = '  '.join('%s %d' % (key, votes) for key, votes in snapshot['leaderboard'])
+    winner = '  (winner: %s)' % snapshot['winner'] if snapshot['winner'] is not None else ''
+    print('%d votes | %s%s' % (snapshot['votes'], standings, winner), flush=True)
+
+
+
+def process(args):
+    '''
+    The process command, offline work on an existing log.
+    '''
+    import processChat
+
+    if args.archive is not None:
+        from chatArchive import convert_log
+        convert_log(args.log, args.archive)
+        print('Archive written to ' + args.archive)
+
+    if args.index is not None:
+        from chatIndex import ChatIndex
+        added = ChatIndex(args.index).update(args.log)
+        print('%d messages added to %s' % (added, args.index))
+
+    if args.clean is not None:
+        processChat.clean_chat(args.log, args.clean, args.users, args.processes,
+                               args.incremental)
+        print('Cleaned chat written to ' + args.clean)
+
+    if args.vocab is not None:
+        wordCount = processChat.chatVocabulary(args.log, incremental=args.incremental)[0]
+        for count, word in wordCount[:args.vocab]:
+            print('%-24s %d' % (word, count))
+
+    if all(option is None for option in (args.archive, args.clean, args.vocab, args.index)):
+        chat = processChat.get_chat_dataframe(args.log, incremental=args.incremental)
+        print('%d messages from %d users' % (len(chat), chat['username'].nunique()))
+        if len(chat) > 0:
+            print('%s to %s' % (chat['dt'].min(), chat['dt'].max()))
+
+
+
+def search(args):
+    '''
+    The search command, prints matching messages or their timeline.
+    '''
+    import time
+    from chatIndex import ChatIndex
+    from processChat import TIME_FORMAT
+
+    index = ChatIndex(args.index)
+    if args.timeline == True:
+        for seconds, count in index.timeline(args.words, args.user, args.start, args.end,
+                                             args.channel):
+            print('%s  %d' % (time.strftime(TIME_FORMAT, time.gmtime(seconds)), count))
+        return
+
+    found = index.search(args.words, args.user, args.phrase, args.start, args.end,
+                         args.channel, args.limit)
+    for record in found:
+        # Index times are local wall clock seconds, formatted as they were logged
+        print('%s #%s %s: %s' % (time.strftime(TIME_FORMAT, time.gmtime(record.dt)),
+                                 record.channel, record.username, record.message))
+    if len(found) == 0:
+        print('No messages found')
+
+
+
+def main(argv=None):
+    '''
+    Entry point, argv defaults to the command line.
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    parser, subparsers = build_parser()
+
+    # Read --config first so its values become defaults for the full parse
+    first = argparse.ArgumentParser(add_help=False)
+    first.add_argument('--config')
+    known, _ = first.parse_known_args(argv)
+    if known.config is not None:
+        apply_config(known.config, parser, subparsers, argv)
+
+    # argparse stops filling search words at the first option, words after it are
+    # left over and added here so options and words can be given in any order
+    args, extra = parser.parse_known_args(argv)
+    if extra:
+        if args.command != 'search' or any(arg.startswith('-') for arg in extra):
+            parser.error('unrecognized arguments: ' + ' '.join(extra))
+        args.words += extra
+
+    run_command(args)
+
+
+
+if __name__ == '__main__':
+    main()
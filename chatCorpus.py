@@ -0,0 +1,259 @@
+#########################################################################################
+#                          Integer encoded training corpus                              #
+#########################################################################################
+# Exports chat straight into integer encoded shards for the Text Generation RNN.
+#
+# characterVocab() and clean_characterVocab() build one large Python string that the
+# training code then has to encode again.  export_corpus() instead streams (cleaned)
+# messages from a log or a chat text file into raw int32 shard files, one message per
+# line as in allChat.txt, and writes the vocabulary next to them in corpus.json.
+#
+#   Levels:  - 'char' : Indices into the sorted character set, the same mapping as
+#                       characterVocab() returns.  Characters are written as code
+#                       points while streaming and remapped in place at the end.
+#
+#            - 'word' : Words split at spaces with '\n' ending each message, indices
+#                       in first-seen order.
+#
+#   ChatCorpus : Memory-maps the shards of an export, window() returns zero copy views
+#                for training batches.
+#
+# A chatDedup.DuplicateFilter passed as dedup keeps copypasta and emote spam bursts
+# from dominating the corpus, only the first keep copies inside its window are written.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import json
+import numpy as np
+from processChat import read_records, records_to_dataframe, clean_blocks, clean_lines
+
+
+
+# Tokens written to each shard file
+SHARD_SIZE = 1 << 26
+
+# Tokens remapped at a time when finishing a character export
+REMAP_SIZE = 1 << 22
+
+
+
+def _log_blocks(logFile, clean=True, withUsers=False, dedup=None):
+    '''
+    Generator of text blocks from logFile, one message per line.
+    '''
+    if clean == True and dedup is None:
+        yield from clean_blocks(logFile, 0, None, withUsers)
+        return
+
+    for records, _ in read_records(logFile, includeTail=True):
+        chat = records_to_dataframe(records)
+        if dedup is not None and len(chat) > 0:
+            seconds = chat['dt'].values.astype('datetime64[s]').astype(np.int64)
+            chat = chat[[dedup.accept(message, stamp)
+                         for stamp, message in zip(seconds.tolist(), chat['message'])]]
+        if clean == True:
+            yield clean_lines(chat, withUsers)
+        elif len(chat) > 0:
+            lines = chat['username'] + ': ' + chat['message'] if withUsers else chat['message']
+            yield '\n'.join(lines) + '\n'
+
+
+
+def _text_blocks(chatText, lines=100000, dedup=None):
+    '''
+    Generator of text blocks from a chat text file such as clean_messages() writes.
+    Without timestamps a dedup window is only bounded by its capacity.
+    '''
+    with open(chatText, 'r', encoding='utf-8') as f:
+        block = []
+        for line in f:
+            if dedup is not None and not dedup.accept(line):
+                continue
+            block.append(line)
+            if len(block) >= lines:
+                yield ''.join(block)
+                block = []
+        if block:
+            yield ''.join(block)
+
+
+
+class _ShardWriter:
+    def __init__(self, directory, shardSize):
+        '''
+        Appends int32 tokens to numbered shard files of up to shardSize tokens.
+        '''
+        self.directory = directory
+        self.shardSize = shardSize
+        self.shards = []
+        self._file = None
+
+
+
+    def write(self, tokens):
+        '''
+        Appends an array of tokens, starting new shards as needed.
+        '''
+        tokens = np.asarray(tokens, dtype=np.int32)
+        while len(tokens) > 0:
+            if self._file is None or self.shards[-1]['tokens'] == self.shardSize:
+                self._next()
+            space = self.shardSize - self.shards[-1]['tokens']
+            self._file.write(tokens[:space].tobytes())
+            self.shards[-1]['tokens'] += len(tokens[:space])
+            tokens = tokens[space:]
+
+
+
+    def _next(self):
+        '''
+        Closes the current shard and opens the next one.
+        '''
+        self.close()
+        name = 'shard-%05d.bin' % len(self.shards)
+        self._file = open(os.path.join(self.directory, name), 'wb')
+        self.shards.append({'name': name, 'tokens': 0})
+
+
+
+    def close(self):
+        '''
+        Closes the current shard file.
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+
+def export_corpus(source, directory, level='char', clean=True, withUsers=False,
+                  shardSize=SHARD_SIZE, dedup=None):
+    '''
+    Encodes the messages of source into int32 shards in directory and returns
+    the ChatCorpus.
+
+    - source is a #channel_chat.log, or a text file with one message per line
+      (anything not ending in '.log'), which is used as is.
+
+    - clean keeps only messages with standard characters, as clean_messages().
+      withUsers writes 'username: message' lines.
+
+    - dedup is a DuplicateFilter, repeated messages it rejects are skipped.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    if source.endswith('.log'):
+        blocks = _log_blocks(source, clean, withUsers, dedup)
+    else:
+        blocks = _text_blocks(source, dedup=dedup)
+
+    writer = _ShardWriter(directory, shardSize)
+    wordIndex = {}
+    codePoints = np.zeros(0, dtype=np.int32)
+
+    for block in blocks:
+        if level == 'char':
+            # utf-32 gives every character's code point without a Python level loop
+            tokens = np.frombuffer(block.encode('utf-32-le'), dtype=np.int32)
+            codePoints = np.union1d(codePoints, np.unique(tokens))
+        else:
+            tokens = []
+            for line in block.splitlines():
+                for word in line.split(' ') + ['\n']:
+                    index = wordIndex.get(word)
+                    if index is None:
+                        index = wordIndex[word] = len(wordIndex)
+                    tokens.append(index)
+        writer.write(tokens)
+
+    writer.close()
+
+    if level == 'char':
+        # Remap code points to indices into the sorted character set
+        vocab = [chr(point) for point in codePoints]
+        for shard in writer.shards:
+            if shard['tokens'] == 0:
+                continue
+            tokens = np.memmap(os.path.join(directory, shard['name']), dtype=np.int32, mode='r+')
+            for i in range(0, len(tokens), REMAP_SIZE):
+                tokens[i:i + REMAP_SIZE] = np.searchsorted(codePoints, tokens[i:i + REMAP_SIZE])
+            tokens.flush()
+            del tokens
+    else:
+        vocab = list(wordIndex)
+
+    with open(os.path.join(directory, 'corpus.json'), 'w', encoding='utf-8') as f:
+        json.dump({'level': level, 'dtype': 'int32', 'shards': writer.shards, 'vocab': vocab}, f)
+
+    return ChatCorpus(directory)
+
+
+
+class ChatCorpus:
+    def __init__(self, directory):
+        '''
+        Memory-maps every shard of an export_corpus() directory.  idx2token and
+        token2idx are the lookup dictionaries for the vocabulary.
+        '''
+        with open(os.path.join(directory, 'corpus.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        self.level = meta['level']
+        self.idx2token = {idx : token for idx, token in enumerate(meta['vocab'])}
+        self.token2idx = {token : idx for idx, token in self.idx2token.items()}
+
+        self.shards = [np.memmap(os.path.join(directory, shard['name']), dtype=meta['dtype'],
+                                 mode='r')
+                       for shard in meta['shards'] if shard['tokens'] > 0]
+        self._starts = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+
+
+    def __len__(self):
+        '''
+        Total number of tokens.
+        '''
+        return int(self._starts[-1])
+
+
+
+    def window(self, start, length):
+        '''
+        Tokens start to start + length.  A view into the shard, with no copy,
+        unless the window crosses a shard boundary.
+        '''
+        shard = int(np.searchsorted(self._starts, start, side='right')) - 1
+        offset = start - int(self._starts[shard])
+        if offset + length <= len(self.shards[shard]):
+            return self.shards[shard][offset:offset + length]
+
+        parts = []
+        while length > 0 and shard < len(self.shards):
+            part = self.shards[shard][offset:offset + length]
+            parts.append(part)
+            length -= len(part)
+            shard += 1
+            offset = 0
+        return np.concatenate(parts)
+
+
+
+    def windows(self, length, step=None):
+        '''
+        Generator over consecutive windows of length tokens, step apart.
+        '''
+        step = length if step is None else step
+        for start in range(0, len(self) - length + 1, step):
+            yield self.window(start, length)
+
+
+
+    def decode(self, tokens):
+        '''
+        Turns a sequence of indices back into text.
+        '''
+        separator = '' if self.level == 'char' else ' '
+        return separator.join(self.idx2token[int(token)] for token in tokens)
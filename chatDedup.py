@@ -0,0 +1,305 @@
+#########################################################################################
+#                            Duplicate and copypasta filter                             #
+#########################################################################################
+# Streaming detection of repeated chat, copypasta and emote spam over a time window.
+#
+# Messages are normalized first (lowercase, whitespace collapsed, the invisible
+# characters people add to get past Twitch's duplicate message check removed).  An
+# exact repeat is found with one dictionary lookup.  Anything else gets a MinHash
+# signature over its character shingles, banded for locality sensitive hashing, so a
+# near duplicate is found by looking up a few band keys rather than comparing it with
+# every message in the window.
+#
+# Similar messages form a cluster that lives for window seconds from its first
+# message.  At most capacity clusters are kept, the oldest are dropped first, so memory
+# stays bounded however fast chat moves.
+#
+#   DuplicateFilter : check() returns a Duplicate (or None for a new message),
+#                     accept() says whether a message is among the first keep copies
+#                     of its cluster.  Giving a key, such as the username, only
+#                     matches messages with the same key.
+#
+#   summary_line : IRC line recording how many copies of a cluster were dropped, a
+#                  NOTICE so the chat log parsers skip it.
+#
+#   Usage:  ChatBot.write_chat(dedup=DuplicateFilter())  -> copies logged as counts
+#           VoteTally(keys, False, dedup=DuplicateFilter(30))  -> one vote per user per
+#                                                                message every 30 s
+#           export_corpus(log, directory, dedup=DuplicateFilter(keep=3))
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import re
+from collections import OrderedDict, deque, namedtuple
+import numpy as np
+
+
+
+# Characters used to make a repeated message look new, removed before comparing
+INVISIBLE = re.compile('[\u00ad\u034f\u115f\u1160\u17b4\u17b5\u180e\u200b-\u200f'
+                       '\u202a-\u202e\u2060-\u2064\u2800\u3164\ufeff\uffa0'
+                       '\U000e0000-\U000e007f]')
+WHITESPACE = re.compile(r'\s+')
+
+# Characters per shingle
+SHINGLE_SIZE = 4
+
+# MinHash with hash functions (a * h + b) mod PRIME over 32 bit shingle hashes
+PRIME = (1 << 31) - 1
+
+# Returned by check() for a repeated message, similarity is 1.0 for an exact repeat
+Duplicate = namedtuple('Duplicate', ['kind', 'cluster', 'similarity'])
+
+
+
+def normalize_text(text):
+    '''
+    Lowercased text with invisible characters removed and whitespace collapsed.
+    '''
+    return WHITESPACE.sub(' ', INVISIBLE.sub('', text.lower())).strip()
+
+
+
+class Cluster:
+    __slots__ = ('id', 'text', 'key', 'first', 'last', 'count', 'dropped', 'signature',
+                 'exactKeys', 'bandKeys')
+
+    def __init__(self, id, text, key, stamp, signature):
+        '''
+        A message and the copies of it seen since stamp.
+        '''
+        self.id = id
+        self.text = text
+        self.key = key
+        self.first = stamp
+        self.last = stamp
+        self.count = 1
+        self.dropped = 0
+        self.signature = signature
+        self.exactKeys = []
+        self.bandKeys = []
+
+
+
+    def __repr__(self):
+        '''
+        Cluster(count, text).
+        '''
+        return 'Cluster(%d, %r)' % (self.count, self.text)
+
+
+
+class DuplicateFilter:
+    def __init__(self, window=30, capacity=10000, keep=1, threshold=0.7, near=True,
+                 numHashes=32, bands=8, seed=0):
+        '''
+        - window is the seconds a cluster lasts from its first message, and
+          capacity the most clusters kept at once.
+
+        - keep is how many copies per cluster accept() lets through.
+
+        - threshold is the estimated shingle similarity (0 - 1) above which a
+          message is a near duplicate.  near=False only finds exact repeats.
+
+        - numHashes MinHash functions are split into bands for the candidate
+          lookup, more bands find less similar candidates.
+        '''
+        self.window = window
+        self.capacity = capacity
+        self.keep = keep
+        self.threshold = threshold
+        self.near = near
+        self.bands = bands
+        self.rows = numHashes // bands
+
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, PRIME, size=(numHashes, 1)).astype(np.uint64)
+        self._b = generator.randint(0, PRIME, size=(numHashes, 1)).astype(np.uint64)
+
+        self.clusters = OrderedDict()
+        self._exact = {}
+        self._bands = {}
+        self._next = 0
+        self.now = 0
+
+        # Clusters that expired with dropped copies, see pop_expired()
+        self.expired = deque(maxlen=capacity)
+
+        self.messages = 0
+        self.exact = 0
+        self.nearDuplicates = 0
+        self.dropped = 0
+
+
+
+    def signature(self, text):
+        '''
+        MinHash signature of the character shingles of normalized text.
+        '''
+        if len(text) <= SHINGLE_SIZE:
+            shingles = {text}
+        else:
+            shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+        hashes = np.fromiter((hash(shingle) & 0xFFFFFFFF for shingle in shingles), np.uint64,
+                             len(shingles))
+        return ((self._a * hashes + self._b) % PRIME).min(axis=1).astype(np.uint32)
+
+
+
+    def check(self, text, stamp=None, key=None):
+        '''
+        Returns a Duplicate when text repeats a message in the window, or None
+        when it starts a new cluster.  stamp is the message time in seconds,
+        without one the window only ends through capacity.
+        '''
+        if stamp is not None:
+            self.now = stamp
+        self._expire()
+        self.messages += 1
+
+        normalized = normalize_text(text)
+        exactKey = (key, normalized)
+        clusterId = self._exact.get(exactKey)
+
+        if clusterId is not None:
+            self.exact += 1
+            return self._repeat(self.clusters[clusterId], 'exact', 1.0)
+
+        signature = None
+        if self.near == True:
+            signature = self.signature(normalized)
+            bandKeys = [(key, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                        for band in range(self.bands)]
+
+            best = None
+            for bandKey in bandKeys:
+                candidate = self.clusters.get(self._bands.get(bandKey))
+                if candidate is None or (best is not None and candidate is best[0]):
+                    continue
+                similarity = float(np.mean(candidate.signature == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (candidate, similarity)
+
+            if best is not None:
+                self.nearDuplicates += 1
+                cluster, similarity = best
+                # Later exact repeats of this variant are found without a signature
+                self._add_exact(exactKey, cluster)
+                return self._repeat(cluster, 'near', similarity)
+
+        cluster = Cluster(self._next, text, key, self.now, signature)
+        self._next += 1
+        self.clusters[cluster.id] = cluster
+        self._add_exact(exactKey, cluster)
+        if signature is not None:
+            for bandKey in bandKeys:
+                self._bands[bandKey] = cluster.id
+                cluster.bandKeys.append(bandKey)
+
+        if len(self.clusters) > self.capacity:
+            self._pop_oldest()
+
+        return None
+
+
+
+    def accept(self, text, stamp=None, key=None):
+        '''
+        True when text is new or one of the first keep copies of its cluster
+        in the window, False for a copy that should be ignored.
+        '''
+        found = self.check(text, stamp, key)
+        return found is None or found.cluster.count <= self.keep
+
+
+
+    def pop_expired(self):
+        '''
+        Returns and forgets the clusters that ended with copies dropped.
+        '''
+        expired = list(self.expired)
+        self.expired.clear()
+        return expired
+
+
+
+    def flush(self):
+        '''
+        Ends every cluster, those with dropped copies go to pop_expired().
+        '''
+        while self.clusters:
+            self._pop_oldest()
+
+
+
+    def stats(self):
+        '''
+        Dictionary of messages checked, exact and near duplicates and drops.
+        '''
+        return {'messages': self.messages, 'exact': self.exact, 'near': self.nearDuplicates,
+                'dropped': self.dropped, 'clusters': len(self.clusters)}
+
+
+
+    def _repeat(self, cluster, kind, similarity):
+        '''
+        Counts another copy of cluster.
+        '''
+        cluster.count += 1
+        cluster.last = self.now
+        if cluster.count > self.keep:
+            cluster.dropped += 1
+            self.dropped += 1
+        return Duplicate(kind, cluster, similarity)
+
+
+
+    def _add_exact(self, exactKey, cluster):
+        '''
+        Maps a normalized text to cluster.
+        '''
+        # Variants are bounded so one long lived cluster cannot grow without limit
+        if len(cluster.exactKeys) < 64:
+            self._exact[exactKey] = cluster.id
+            cluster.exactKeys.append(exactKey)
+
+
+
+    def _expire(self):
+        '''
+        Drops clusters whose window has passed.
+        '''
+        clusters = self.clusters
+        while clusters and self.now - clusters[next(iter(clusters))].first > self.window:
+            self._pop_oldest()
+
+
+
+    def _pop_oldest(self):
+        '''
+        Removes the oldest cluster and everything pointing at it.
+        '''
+        clusterId, cluster = self.clusters.popitem(last=False)
+        for exactKey in cluster.exactKeys:
+            if self._exact.get(exactKey) == clusterId:
+                del self._exact[exactKey]
+        for bandKey in cluster.bandKeys:
+            if self._bands.get(bandKey) == clusterId:
+                del self._bands[bandKey]
+        if cluster.dropped > 0:
+            self.expired.append(cluster)
+
+
+
+def summary_line(cluster, channel):
+    '''
+    NOTICE line for the log recording the copies of cluster that were dropped.
+    channel is given with or without the leading #.
+    '''
+    text = cluster.text.replace('\r', ' ').replace('\n', ' ')
+    return ('@msg-id=duplicates;count=%d;first-ts=%d;last-ts=%d :tmi.twitch.tv NOTICE #%s :%s'
+            % (cluster.dropped, cluster.first * 1000, cluster.last * 1000, channel.lstrip('#'),
+               text))
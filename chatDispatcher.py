@@ -0,0 +1,247 @@
+#########################################################################################
+#                                Chat dispatcher                                        #
+#########################################################################################
+# Fans one stream of chat out to any number of handlers so logging, vote counting and
+# contests can all run at the same time from a single reader.
+#
+# The reader parses each line once and hands the ChatMessage to dispatch().  Every
+# handler has its own bounded queue and thread, so a slow handler only backs up its
+# own queue and never holds up the reader or the other handlers.
+#
+#   ChatDispatcher : register() handlers, dispatch() messages, close() when done.
+#
+#   Handlers:  - LogHandler : Logs chat to a #channel_chat.log through a ChatWriter.
+#              - VoteHandler : Live VoteTally over a voteLibrary.
+#              - ContestHandler : Runs phrase contests through a ContestEngine.
+#              - PrintHandler : Prints chat to the console.
+#
+# Any callable taking a ChatMessage can also be registered.  Objects with a close()
+# method have it called when the dispatcher closes.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import threading
+import queue
+from chatWriter import ChatWriter
+from voteTally import VoteTally, load_vote_library
+from contestEngine import ContestEngine, Contest, announce
+
+
+
+class _HandlerThread:
+    def __init__(self, handler, name, queueSize, dropWhenFull):
+        '''
+        Queue and worker thread feeding one handler.
+        '''
+        self.handler = handler
+        self.name = name
+        self.dropWhenFull = dropWhenFull
+        self.queue = queue.Queue(queueSize)
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name='ChatDispatcher ' + name,
+                                       daemon=True)
+
+
+
+    def put(self, message):
+        '''
+        Queues a message, when full either waits or drops it.
+        '''
+        if self.dropWhenFull == True:
+            try:
+                self.queue.put_nowait(message)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            self.queue.put(message)
+
+
+
+    def _run(self):
+        '''
+        Calls the handler for every queued message until the None sentinel.
+        '''
+        handle = getattr(self.handler, 'handle', self.handler)
+        while True:
+            message = self.queue.get()
+            if message is None:
+                return
+            try:
+                handle(message)
+            except Exception:
+                # A failing handler must not stop the others or the reader
+                self.errors += 1
+            self.handled += 1
+
+
+
+class ChatDispatcher:
+    def __init__(self):
+        '''
+        Dispatcher with no handlers, register() them before start().
+        '''
+        self._handlers = []
+        self._started = False
+
+
+
+    def register(self, handler, name=None, queueSize=10000, dropWhenFull=False):
+        '''
+        Adds a handler, either an object with handle(message) or a callable.
+
+        - queueSize bounds the messages waiting for this handler.
+
+        - dropWhenFull drops messages for this handler when its queue is full
+          instead of making the reader wait.
+        '''
+        if name is None:
+            name = getattr(handler, 'name', type(handler).__name__)
+        worker = _HandlerThread(handler, name, queueSize, dropWhenFull)
+        self._handlers.append(worker)
+        if self._started == True:
+            worker.thread.start()
+        return handler
+
+
+
+    def start(self):
+        '''
+        Starts every handler thread.
+        '''
+        if self._started == False:
+            self._started = True
+            for worker in self._handlers:
+                worker.thread.start()
+        return self
+
+
+
+    def dispatch(self, message):
+        '''
+        Hands one parsed ChatMessage to every handler.
+        '''
+        for worker in self._handlers:
+            worker.put(message)
+
+
+
+    def stats(self):
+        '''
+        Returns queue depth, handled, dropped and error counts per handler.
+        '''
+        return {worker.name: {'depth': worker.queue.qsize(), 'handled': worker.handled,
+                              'dropped': worker.dropped, 'errors': worker.errors}
+                for worker in self._handlers}
+
+
+
+    def close(self):
+        '''
+        Lets every handler finish its queue, then closes the handlers.
+        '''
+        for worker in self._handlers:
+            worker.queue.put(None)
+        for worker in self._handlers:
+            if worker.thread.is_alive():
+                worker.thread.join()
+            if hasattr(worker.handler, 'close'):
+                worker.handler.close()
+        self._started = False
+
+
+
+class LogHandler:
+    def __init__(self, logFile):
+        '''
+        Logs every message to logFile in the write_chat record format.
+        '''
+        self.name = 'log ' + logFile
+        self.writer = ChatWriter(logFile).start()
+
+
+
+    def handle(self, message):
+        '''
+        Queues the raw line for the writer thread.
+        '''
+        self.writer.write(message.raw, message.serverTime)
+
+
+
+    def close(self):
+        '''
+        Writes out everything still queued.
+        '''
+        self.writer.close()
+
+
+
+class VoteHandler:
+    def __init__(self, voteLibrary='voteLibrary.txt', uniqueUsers=True):
+        '''
+        Tallies votes for the keys in voteLibrary, see voteTally.VoteTally.
+        '''
+        self.name = 'votes'
+        self.tally = VoteTally(load_vote_library(voteLibrary), uniqueUsers)
+
+
+
+    def handle(self, message):
+        '''
+        Tallies one message.
+        '''
+        self.tally.add_message(message)
+
+
+
+    def results(self):
+        '''
+        Returns a dictionary of vote key to tallied votes.
+        '''
+        return self.tally.results()
+
+
+
+class ContestHandler:
+    def __init__(self, winningPhrase, winners=1, onWinner=announce, ignoreCase=False,
+                 wholeWord=False):
+        '''
+        Runs a contest for winningPhrase (or a list of phrases) through a
+        ContestEngine, onWinner(winner) is called for each Winner.
+        '''
+        self.name = 'contest'
+        self.engine = ContestEngine(onWinner)
+        phrases = [winningPhrase] if isinstance(winningPhrase, str) else winningPhrase
+        for phrase in phrases:
+            self.engine.add(Contest(phrase, winners, ignoreCase, wholeWord))
+        self.found = []
+
+
+
+    def handle(self, message):
+        '''
+        Checks one message against the open contests.
+        '''
+        self.found += self.engine.check(message)
+
+
+
+class PrintHandler:
+    def __init__(self):
+        '''
+        Prints every raw chat line.
+        '''
+        self.name = 'print'
+
+
+
+    def handle(self, message):
+        '''
+        Prints the raw line.
+        '''
+        print(message.raw)
@@ -0,0 +1,240 @@
+#########################################################################################
+#                             Multi-channel chat engine                                 #
+#########################################################################################
+# asyncio based engine that follows many Twitch channels at once.
+#
+# ChatBot holds one blocking socket for one channel.  ChatEngine instead JOINs any
+# number of channels over a small pool of connections, each connection carrying up to
+# channelsPerConnection channels, and passes every parsed line to the handlers
+# registered for its channel.
+#
+#   Methods:  - add_handler : Register a callable for one channel or for all channels.
+#
+#             - run : Coroutine, connects the pool and reads until runtime ends.
+#
+#             - run_sync : Blocking facade around run() for scripts and runBot.py.
+#
+#             - stop : Ends a running engine.
+#
+# When logChat is set every channel is logged to its own '#channel_chat.log', in the
+# same record format written by ChatBot.write_chat so processChat can load it.
+#
+# The Twitch JOIN limit is per account, so every connection counts its JOINs against
+# one shared sendQueue.SlidingWindow, reconnects included.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import asyncio
+from chatMessage import parse_line
+from sendQueue import SlidingWindow
+from chatWriter import ChatWriter
+from chatNormalizer import MessageNormalizer
+
+
+
+class ChatEngine:
+    def __init__(self, nickname, channels,
+                 server = 'irc.chat.twitch.tv',
+                 port = 6667,
+                 token = None,
+                 channelsPerConnection = 100,
+                 logChat = True,
+                 capabilities = None,
+                 ):
+        '''
+        - channels is a list of channel names in the form '#channelname'.
+
+        - Channels are split into groups of channelsPerConnection, one connection
+          is opened for each group.
+
+        - logChat writes every channel to its own '#channel_chat.log'.
+
+        - capabilities are requested with CAP REQ on every connection, such as
+          ['twitch.tv/tags', 'twitch.tv/membership'].
+        '''
+        self.nickname = nickname
+        self.channels = ['#' + channel.lower().lstrip('#') for channel in channels]
+        self.server = server
+        self.port = port
+        self.token = token
+        self.channelsPerConnection = channelsPerConnection
+        self.logChat = logChat
+        self.capabilities = capabilities if capabilities is not None else []
+
+        # Twitch allows 20 JOINs every 10 seconds for a normal account, across all connections
+        self.joinBatch = 20
+        self.joinInterval = 10
+        self._joins = None
+        self._joinLock = None
+
+        # Handlers keyed by channel name without the '#', None holds catch-all handlers
+        self.handlers = {}
+        self.logFiles = {}
+        self._running = False
+
+        # Normalization applied to each message before handlers and logging, None to disable
+        self.normalizer = MessageNormalizer()
+
+        if token == None:
+            print('\n\n*** Specificy an OAuth Token ***\n\n')
+
+
+
+    def add_handler(self, handler, channel=None):
+        '''
+        Registers handler(message) for a '#channel', or for every channel when
+        channel is None.  Handlers may be plain functions or coroutine functions.
+        '''
+        if channel is not None:
+            channel = channel.lower().lstrip('#')
+        self.handlers.setdefault(channel, []).append(handler)
+
+
+
+    async def _dispatch(self, message):
+        '''
+        Sends a message to the catch-all handlers and those for its channel.
+        '''
+        for handler in self.handlers.get(None, []) + self.handlers.get(message.channel, []):
+            result = handler(message)
+            if asyncio.iscoroutine(result):
+                await result
+
+
+
+    def _log(self, message):
+        '''
+        Appends a record to the channel's log file.
+        '''
+        writer = self.logFiles.get(message.channel)
+        if writer is None:
+            writer = ChatWriter('#' + message.channel + '_chat.log').start()
+            self.logFiles[message.channel] = writer
+
+        writer.write(message.raw, message.serverTime)
+
+
+
+    async def _join(self, writer, channels):
+        '''
+        JOINs channels in batches, counting every channel against the join
+        window shared by every connection.
+        '''
+        for i in range(0, len(channels), self.joinBatch):
+            batch = channels[i:i + self.joinBatch]
+            # A batch is counted when it is sent, one connection at a time, so the
+            # window sees the JOINs when Twitch does
+            async with self._joinLock:
+                while not self._joins.take(len(batch)):
+                    await asyncio.sleep(self._joins.wait_time(len(batch)))
+                writer.write(f"JOIN {','.join(batch)}\r\n".encode('utf-8'))
+                await writer.drain()
+
+
+
+    async def _connection(self, channels):
+        '''
+        Opens one connection for a group of channels and reads it until stopped.
+        A dropped connection is reopened after a short wait.
+        '''
+        while self._running:
+            try:
+                reader, writer = await asyncio.open_connection(self.server, self.port)
+            except OSError:
+                await asyncio.sleep(5)
+                continue
+
+            if self.capabilities:
+                writer.write(f"CAP REQ :{' '.join(self.capabilities)}\r\n".encode('utf-8'))
+            writer.write(f"PASS {self.token}\r\n".encode('utf-8'))
+            writer.write(f"NICK {self.nickname}\r\n".encode('utf-8'))
+            joining = asyncio.ensure_future(self._join(writer, channels))
+
+            try:
+                while self._running:
+                    line = await reader.readline()
+                    if len(line) == 0:
+                        break
+
+                    line = line.rstrip(b'\r\n').decode('utf-8', errors='replace')
+                    if len(line) == 0:
+                        continue
+
+                    message = parse_line(line)
+                    if message.command == 'PING':
+                        writer.write(f"PONG :{message.message}\r\n".encode('utf-8'))
+                        continue
+
+                    if message.channel is None:
+                        continue
+
+                    if self.normalizer is not None:
+                        message = self.normalizer.normalize_message(message)
+
+                    if self.logChat == True:
+                        self._log(message)
+                    await self._dispatch(message)
+
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+
+            finally:
+                joining.cancel()
+                writer.close()
+
+            if self._running:
+                await asyncio.sleep(5)
+
+
+
+    async def run(self, runtime=None):
+        '''
+        Connects every channel group and reads chat for runtime seconds,
+        or until stop() is called when runtime is None.
+        '''
+        self._running = True
+        self._joins = SlidingWindow(self.joinBatch, self.joinInterval)
+        self._joinLock = asyncio.Lock()
+        size = self.channelsPerConnection
+        groups = [self.channels[i:i + size] for i in range(0, len(self.channels), size)]
+        tasks = [asyncio.ensure_future(self._connection(group)) for group in groups]
+
+        try:
+            if runtime is None:
+                await asyncio.gather(*tasks)
+            else:
+                await asyncio.wait(tasks, timeout=runtime)
+        finally:
+            self.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for writer in self.logFiles.values():
+                writer.close()
+            self.logFiles = {}
+
+
+
+    def stop(self):
+        '''
+        Ends a running engine after the current line.
+        '''
+        self._running = False
+
+
+
+    def run_sync(self, runtime=None):
+        '''
+        Blocking wrapper around run(), Ctrl-C ends the session.
+        '''
+        try:
+            asyncio.run(self.run(runtime))
+        except KeyboardInterrupt:
+            print('\nChat logging canceled')
+            return
+
+        if runtime is not None:
+            print('\n%d seconds of chat logged from %d channels\n' % (runtime, len(self.channels)))
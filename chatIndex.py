@@ -0,0 +1,390 @@
+#########################################################################################
+#                               Chat search index                                       #
+#########################################################################################
+# On-disk inverted index over #channel_chat.log files for finding what a user said or
+# when a phrase was used without loading whole logs into a dataframe.
+#
+# The index is a single SQLite file.  Every chat record gets a row with its log, byte
+# position, timestamp and channel, and postings map each lowercased word and each
+# username to (time bucket, record).  Postings are stored clustered by word then
+# bucket, so a query only touches the buckets of its time range and messages are read
+# back from the logs by seeking straight to their records.
+#
+#   ChatIndex : update() indexes whatever was appended to a log since the last update,
+#               search() returns the matching ChatRecords (search_dataframe() as a
+#               dataframe), timeline() counts matches per time bucket from the index
+#               alone.
+#
+#   IndexUpdater : Background thread running update() for one log whenever notify()
+#                  is called, so the log writer never waits on the index.
+#
+#   index_logs : Indexes existing logs in bulk.
+#
+#   Usage:  index = ChatIndex('chat.index')
+#           index.update('#channel_chat.log')
+#           index.search(username='someuser', start='2020-05-01', limit=20)
+#           index.search(phrase='good game', channels=['#channel'])
+#           index.timeline(words=['pogchamp'])
+#
+# ChatBot.write_chat(index=index) keeps the index current while logging, the log
+# writer notifies an IndexUpdater after every batch it writes.  A failed update (for
+# example the database locked by another process) is counted and retried on the next
+# notify, it never holds up logging.  A log that was truncated or recreated is indexed
+# again from the start.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import re
+import sqlite3
+import threading
+from processChat import (read_record_spans, parse_record, log_head, log_changed,
+                         records_to_columns, columns_to_dataframe)
+from chatArchive import to_seconds
+
+
+
+# Words are runs of letters, digits and underscores, matched case-insensitively
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Seconds per time bucket
+BUCKET_SECONDS = 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, path TEXT UNIQUE,
+                                 offset INTEGER, head TEXT);
+CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, log INTEGER, start INTEGER,
+                                    length INTEGER, dt INTEGER, channel TEXT);
+CREATE INDEX IF NOT EXISTS records_dt ON records (dt);
+CREATE TABLE IF NOT EXISTS words (word TEXT, bucket INTEGER, record INTEGER,
+                                  PRIMARY KEY (word, bucket, record)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS users (username TEXT, bucket INTEGER, record INTEGER,
+                                  PRIMARY KEY (username, bucket, record)) WITHOUT ROWID;
+'''
+
+# Bucket range used when a query has no start or end
+NO_LIMIT = 1 << 62
+
+
+
+def tokenize(text):
+    '''
+    List of the lowercased words in text.
+    '''
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+
+class ChatIndex:
+    def __init__(self, indexFile, bucketSeconds=BUCKET_SECONDS):
+        '''
+        Opens or creates the index in indexFile.  bucketSeconds only applies
+        to a new index, an existing one keeps the size it was built with.
+        '''
+        self.indexFile = indexFile
+        # The log writer thread updates the index while the bot reads chat
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(indexFile, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'bucketSeconds'").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO meta VALUES ('bucketSeconds', ?)", (bucketSeconds,))
+            self._db.commit()
+            row = (bucketSeconds,)
+        self.bucketSeconds = row[0]
+
+
+
+    def update(self, logFile):
+        '''
+        Indexes the records appended to logFile since its last update, or the
+        whole log the first time.  Returns the number of chat records added.
+        '''
+        path = os.path.abspath(logFile)
+        if not os.path.exists(path):
+            return 0
+
+        with self._lock:
+            db = self._db
+            row = db.execute('SELECT id, offset, head FROM logs WHERE path = ?',
+                             (path,)).fetchone()
+            head = log_head(path)
+
+            if row is None:
+                logId = db.execute('INSERT INTO logs (path, offset, head) VALUES (?, 0, ?)',
+                                   (path, head)).lastrowid
+                offset = 0
+            else:
+                logId, offset, oldHead = row
+                if log_changed(path, offset, oldHead, head):
+                    self._drop_records(logId)
+                    offset = 0
+
+            nextId = (db.execute('SELECT MAX(id) FROM records').fetchone()[0] or 0) + 1
+            added = 0
+            bucketSeconds = self.bucketSeconds
+
+            for spans, offset in read_record_spans(path, offset):
+                records, words, users = [], [], []
+                for start, length, text in spans:
+                    record = parse_record(text)
+                    if record is None:
+                        continue
+                    bucket = record.dt // bucketSeconds
+                    records.append((nextId, logId, start, length, record.dt, record.channel))
+                    users.append((record.username.lower(), bucket, nextId))
+                    words.extend((word, bucket, nextId)
+                                 for word in set(tokenize(record.message)))
+                    nextId += 1
+
+                db.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)', records)
+                db.executemany('INSERT INTO words VALUES (?, ?, ?)', words)
+                db.executemany('INSERT INTO users VALUES (?, ?, ?)', users)
+                db.execute('UPDATE logs SET offset = ?, head = ? WHERE id = ?',
+                           (offset, head, logId))
+                db.commit()
+                added += len(records)
+
+        return added
+
+
+
+    def _drop_records(self, logId):
+        '''
+        Removes everything indexed for a log.
+        '''
+        db = self._db
+        for table in ('words', 'users'):
+            db.execute('DELETE FROM %s WHERE record IN (SELECT id FROM records WHERE log = ?)'
+                       % table, (logId,))
+        db.execute('DELETE FROM records WHERE log = ?', (logId,))
+        db.execute('UPDATE logs SET offset = 0, head = ? WHERE id = ?', ('', logId))
+
+
+
+    def _query(self, select, words, username, start, end, channels):
+        '''
+        SQL and parameters selecting from records r joined with logs l every
+        record matching all the words, the username, time range and channels.
+        '''
+        startSeconds = -NO_LIMIT if start is None else to_seconds(start)
+        endSeconds = NO_LIMIT if end is None else to_seconds(end)
+        buckets = (startSeconds // self.bucketSeconds, endSeconds // self.bucketSeconds)
+
+        matches = []
+        parameters = []
+        for word in words:
+            matches.append('SELECT record FROM words WHERE word = ? AND bucket BETWEEN ? AND ?')
+            parameters.extend((word,) + buckets)
+        if username is not None:
+            matches.append('SELECT record FROM users WHERE username = ? '
+                           'AND bucket BETWEEN ? AND ?')
+            parameters.extend((username.lower(),) + buckets)
+
+        sql = 'SELECT ' + select + ' FROM records r JOIN logs l ON l.id = r.log WHERE '
+        if matches:
+            sql += 'r.id IN (' + ' INTERSECT '.join(matches) + ') AND '
+        sql += 'r.dt BETWEEN ? AND ?'
+        parameters.extend((startSeconds, endSeconds))
+
+        if channels is not None:
+            channels = [channel.lstrip('#') for channel in channels]
+            sql += ' AND r.channel IN (' + ', '.join('?' * len(channels)) + ')'
+            parameters.extend(channels)
+
+        return sql, parameters
+
+
+
+    def search(self, words=None, username=None, phrase=None, start=None, end=None,
+               channels=None, limit=None):
+        '''
+        Returns the ChatRecords, oldest first, of messages containing every word
+        in words (a string or list), sent by username, containing phrase as
+        consecutive words, between start and end (datetimes or date strings,
+        inclusive) in the given channels.  Only the matching records are read
+        from the logs.
+        '''
+        words = tokenize(words) if isinstance(words, str) else [w.lower() for w in words or []]
+        phraseWords = tokenize(phrase) if phrase is not None else []
+
+        with self._lock:
+            sql, parameters = self._query('l.path, r.start, r.length', words + phraseWords,
+                                          username, start, end, channels)
+            sql += ' ORDER BY r.dt, r.id'
+            # A phrase is checked against the message itself, so count after that
+            if limit is not None and not phraseWords:
+                sql += ' LIMIT %d' % limit
+            hits = self._db.execute(sql, parameters).fetchall()
+
+        found = []
+        files = {}
+        try:
+            for path, start, length in hits:
+                f = files.get(path)
+                if f is None:
+                    f = files[path] = open(path, 'rb')
+                f.seek(start)
+                record = parse_record(f.read(length).decode('utf-8', errors='replace'))
+                if record is None:
+                    continue
+                if phraseWords and not _contains(tokenize(record.message), phraseWords):
+                    continue
+                found.append(record)
+                if limit is not None and len(found) >= limit:
+                    break
+        finally:
+            for f in files.values():
+                f.close()
+
+        return found
+
+
+
+    def search_dataframe(self, *args, **kwargs):
+        '''
+        search() results as a dt/channel/username/message dataframe.
+        '''
+        return columns_to_dataframe(records_to_columns(self.search(*args, **kwargs)))
+
+
+
+    def timeline(self, words=None, username=None, start=None, end=None, channels=None):
+        '''
+        List of (bucket start seconds, matches) for the buckets holding
+        messages with every word in words, sent by username.  Counted from the
+        index alone without reading any log.
+        '''
+        words = tokenize(words) if isinstance(words, str) else [w.lower() for w in words or []]
+        with self._lock:
+            sql, parameters = self._query('r.dt / %d AS b, COUNT(*)' % self.bucketSeconds,
+                                          words, username, start, end, channels)
+            rows = self._db.execute(sql + ' GROUP BY b ORDER BY b', parameters).fetchall()
+
+        return [(bucket * self.bucketSeconds, count) for bucket, count in rows]
+
+
+
+    def stats(self):
+        '''
+        Dictionary of indexed logs, records, distinct words and users.
+        '''
+        with self._lock:
+            count = lambda sql: self._db.execute(sql).fetchone()[0]
+            return {'logs': count('SELECT COUNT(*) FROM logs'),
+                    'records': count('SELECT COUNT(*) FROM records'),
+                    'words': count('SELECT COUNT(DISTINCT word) FROM words'),
+                    'users': count('SELECT COUNT(DISTINCT username) FROM users')}
+
+
+
+    def close(self):
+        '''
+        Closes the index file.
+        '''
+        with self._lock:
+            self._db.close()
+
+
+
+class IndexUpdater:
+    def __init__(self, index, logFile):
+        '''
+        Keeps index up to date with logFile from a background thread.
+        '''
+        self.index = index
+        self.logFile = logFile
+        self.updates = 0
+        self.errors = 0
+        self.lastError = None
+
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+
+
+    def start(self):
+        '''
+        Starts the update thread.
+        '''
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='IndexUpdater ' + self.logFile,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+
+
+    def notify(self):
+        '''
+        Asks for an update, several requests before it runs become one.
+        '''
+        self._wake.set()
+
+
+
+    def close(self):
+        '''
+        Runs a last update for everything written, then stops the thread.
+        '''
+        if self._thread is None:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+
+
+    def _update(self):
+        '''
+        One update, errors are kept rather than raised.
+        '''
+        try:
+            self.index.update(self.logFile)
+            self.updates += 1
+        except Exception as error:
+            self.errors += 1
+            self.lastError = error
+
+
+
+    def _run(self):
+        '''
+        Update thread, waits for notify() and updates the index.
+        '''
+        while self._running:
+            self._wake.wait()
+            self._wake.clear()
+            self._update()
+        self._update()
+
+
+
+def _contains(tokens, phrase):
+    '''
+    True when the list phrase appears as consecutive items of tokens.
+    '''
+    size = len(phrase)
+    return any(tokens[i:i + size] == phrase for i in range(len(tokens) - size + 1))
+
+
+
+def index_logs(indexFile, logFiles):
+    '''
+    Brings the index in indexFile up to date with every log in logFiles and
+    returns the ChatIndex.
+    '''
+    index = ChatIndex(indexFile)
+    for logFile in logFiles:
+        index.update(logFile)
+
+    return index
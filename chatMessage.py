@@ -0,0 +1,233 @@
+#########################################################################################
+#                                Chat message parsing                                   #
+#########################################################################################
+# Parsing for single raw IRC lines received from Twitch chat.
+#
+# The ChatBot reader splits the socket stream into complete IRC lines and each line is
+# handed to parse_line() which returns a ChatMessage.  Parsing is done with plain string
+# splits, no regex, since this runs once for every line of chat received.
+#
+#   Line form:   [@tags] [:prefix] COMMAND [params ...] [:trailing]
+#
+#   Example:     :user!user@user.tmi.twitch.tv PRIVMSG #channel :hello chat
+#
+# When the bot requests the twitch.tv/tags capability every line starts with IRCv3 tags
+# ('@key=value;key=value ').  These are split into a dictionary, again without regex,
+# and ChatMessage exposes the useful ones directly:
+#
+#     userId : Twitch user id, stable across name changes.
+#     serverTime : When Twitch received the message, epoch seconds.
+#     emotes : (emoteId, start, end) ranges of the emotes within message.
+#
+# Usernames and channels are interned, a busy channel repeats the same few thousand
+# names millions of times and every message then shares one copy of each.
+#
+#   ChatRecord : Compact __slots__ record of one chat message (dt, channel, username,
+#                message) with dt as integer local wall clock seconds, the form used by
+#                chatArchive.  processChat.records_to_columns() turns a list of them
+#                into numpy columns.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import sys
+import time
+import calendar
+from collections import namedtuple
+
+
+
+# Escaped characters in IRCv3 tag values
+TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+
+
+
+# received is the time.time() the line arrived, when the reader knows it.  tags is the
+# dictionary of IRCv3 tags, None when the line had none.
+class ChatMessage(namedtuple('ChatMessage', ['raw', 'command', 'username', 'channel',
+                                             'message', 'received', 'tags'],
+                             defaults=(None, None))):
+    __slots__ = ()
+
+    @property
+    def userId(self):
+        '''
+        Twitch user id from the tags, None without tags.
+        '''
+        return self.tags.get('user-id') if self.tags else None
+
+
+
+    @property
+    def serverTime(self):
+        '''
+        Server timestamp (tmi-sent-ts) as epoch seconds, None without tags.
+        '''
+        stamp = self.tags.get('tmi-sent-ts') if self.tags else None
+        return int(stamp) / 1000 if stamp else None
+
+
+
+    @property
+    def emotes(self):
+        '''
+        List of (emoteId, start, end) for every emote in message, sorted by
+        start, so message[start:end] is the emote.  MessageNormalizer moves
+        the ranges along with the text, so they also hold after normalizing.
+        '''
+        found = self.tags.get('emotes') if self.tags else None
+        if not found:
+            return []
+
+        emotes = []
+        for emote in found.split('/'):
+            emoteId, _, ranges = emote.partition(':')
+            for span in ranges.split(','):
+                start, _, end = span.partition('-')
+                emotes.append((emoteId, int(start), int(end) + 1))
+        emotes.sort(key=lambda emote: emote[1])
+        return emotes
+
+
+
+    def emote_names(self):
+        '''
+        The text of every emote in message, in order.
+        '''
+        return [self.message[start:end] for _, start, end in self.emotes]
+
+
+
+def _unescape(value):
+    '''
+    Undoes IRCv3 tag value escaping.
+    '''
+    text = []
+    escaped = False
+    for char in value:
+        if escaped == True:
+            text.append(TAG_ESCAPES.get(char, char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        else:
+            text.append(char)
+    return ''.join(text)
+
+
+
+def parse_tags(text):
+    '''
+    Splits an IRCv3 tag string (without the leading '@') into a dictionary.
+    '''
+    tags = {}
+    for item in text.split(';'):
+        key, _, value = item.partition('=')
+        tags[key] = _unescape(value) if '\\' in value else value
+    return tags
+
+
+
+def parse_line(line, received=None):
+    '''
+    Parses one raw IRC line (without the trailing '\\r\\n') into a ChatMessage.
+
+    - username is taken from the prefix nick and is None for server messages.
+    - channel is the first parameter when it is a '#channel', otherwise None.
+    - message is the trailing parameter, '' when there is none.
+    - tags is the dictionary of IRCv3 tags, None when the line has none.
+    '''
+    prefix = None
+    tags = None
+    rest = line
+
+    if rest.startswith('@'):
+        tagText, _, rest = rest[1:].partition(' ')
+        tags = parse_tags(tagText)
+
+    if rest.startswith(':'):
+        prefix, _, rest = rest[1:].partition(' ')
+
+    # Trailing parameter is everything after the first ' :'
+    if rest.startswith(':'):
+        params, message = '', rest[1:]
+    else:
+        params, _, message = rest.partition(' :')
+
+    params = params.split()
+    command = params[0] if params else ''
+
+    username = None
+    if prefix is not None and '!' in prefix:
+        username = sys.intern(prefix[:prefix.index('!')])
+
+    channel = None
+    if len(params) > 1 and params[1].startswith('#'):
+        channel = sys.intern(params[1][1:])
+
+    return ChatMessage(line, command, username, channel, message, received, tags)
+
+
+
+def local_seconds(stamp):
+    '''
+    Converts time.time() epoch seconds to integer local wall clock seconds.
+    '''
+    return calendar.timegm(time.localtime(stamp))
+
+
+
+class ChatRecord:
+    __slots__ = ('dt', 'channel', 'username', 'message')
+
+    def __init__(self, dt, channel, username, message):
+        '''
+        - dt is integer local wall clock seconds, as local_seconds() returns.
+
+        - channel (without the '#') and username are interned.
+        '''
+        self.dt = dt
+        self.channel = sys.intern(channel)
+        self.username = sys.intern(username)
+        self.message = message
+
+
+
+    @classmethod
+    def from_message(cls, message):
+        '''
+        Record of a PRIVMSG ChatMessage, stamped with the server time when the
+        message has tags, otherwise when it was received.
+        '''
+        stamp = message.serverTime
+        if stamp is None:
+            stamp = message.received if message.received is not None else time.time()
+        return cls(local_seconds(stamp), message.channel, message.username, message.message)
+
+
+
+    def __iter__(self):
+        '''
+        Unpacks as (dt, channel, username, message).
+        '''
+        return iter((self.dt, self.channel, self.username, self.message))
+
+
+
+    def __eq__(self, other):
+        '''
+        Records are equal when every field is.
+        '''
+        if not isinstance(other, ChatRecord):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+
+
+    def __repr__(self):
+        '''
+        Shows the fields like a namedtuple.
+        '''
+        return 'ChatRecord(dt=%d, channel=%r, username=%r, message=%r)' % tuple(self)
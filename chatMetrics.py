@@ -0,0 +1,350 @@
+#########################################################################################
+#                                Ingest metrics                                         #
+#########################################################################################
+# Counters, gauges and histograms for the ChatBot ingest loop, readable as Prometheus
+# text from render() or over HTTP from serve().
+#
+#   Counter : Only goes up, bytes received, messages parsed, PINGs, reconnects ...
+#
+#   Gauge : Current value, such as a queue depth.  Either set() or read from a
+#           function each time the metrics are rendered.
+#
+#   Histogram : Fixed buckets, used for the seconds each stage (parse, normalize,
+#               write ...) takes per message.
+#
+#   MetricsRegistry : Creates and holds the metrics.  stage(name) returns a reusable
+#                     context manager that times a stage into the stage_seconds
+#                     histogram.  profile() turns on cProfile for chosen stages,
+#                     optionally only every n-th call so the cost stays low under load.
+#
+#   Usage:  bot.metrics.serve(9100)          -> http://127.0.0.1:9100/metrics
+#           bot.metrics.profile('parse', every=100)
+#           bot.metrics.profile_stats('parse').sort_stats('cumulative').print_stats(10)
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import time
+import bisect
+import threading
+
+
+
+# Seconds, from a microsecond parse up to a slow disk write
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3,
+                   5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+
+def _labels(labels):
+    '''
+    Prometheus label text for a dictionary of labels, '' when empty.
+    '''
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels.items()) + '}'
+
+
+
+def _number(value):
+    '''
+    Prometheus text for a sample value.
+    '''
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help='', labels=None, function=None):
+        '''
+        Counter starting at 0, or reading function() when given.
+        '''
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.function = function
+        self.value = 0
+
+
+
+    def inc(self, amount=1):
+        '''
+        Adds amount.
+        '''
+        self.value += amount
+
+
+
+    def samples(self):
+        '''
+        List of (name, labels, value) for rendering.
+        '''
+        value = self.function() if self.function is not None else self.value
+        return [(self.name, self.labels, value)]
+
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value):
+        '''
+        Sets the current value.
+        '''
+        self.value = value
+
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help='', labels=None, buckets=LATENCY_BUCKETS):
+        '''
+        Histogram over the sorted bucket upper bounds.
+        '''
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+
+    def observe(self, value):
+        '''
+        Records one value.
+        '''
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+
+    def samples(self):
+        '''
+        Cumulative bucket, sum and count samples for rendering.
+        '''
+        samples = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            samples.append((self.name + '_bucket', dict(self.labels, le=_number(bound)), total))
+        samples.append((self.name + '_sum', self.labels, self.sum))
+        samples.append((self.name + '_count', self.labels, self.count))
+        return samples
+
+
+
+class _Stage:
+    def __init__(self, histogram):
+        '''
+        Times each use with a stage into histogram, profiling it when a
+        profiler is set.
+        '''
+        self.histogram = histogram
+        self.profiler = None
+        self.active = False
+        self.every = 1
+        self.calls = 0
+        self._profiling = False
+        self._start = 0.0
+
+
+
+    def __enter__(self):
+        '''
+        Starts the timer, and the profiler on every every-th call.
+        '''
+        if self.active == True:
+            self.calls += 1
+            if self.calls % self.every == 0:
+                self._profiling = True
+                self.profiler.enable()
+        self._start = time.perf_counter()
+        return self
+
+
+
+    def __exit__(self, *exc):
+        '''
+        Records the time taken.
+        '''
+        self.histogram.observe(time.perf_counter() - self._start)
+        if self._profiling == True:
+            self.profiler.disable()
+            self._profiling = False
+        return False
+
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='chatbot'):
+        '''
+        Empty registry, every metric name is prefixed with prefix + '_'.
+        '''
+        self.prefix = prefix
+        self.metrics = {}
+        self.stages = {}
+        self._server = None
+        self._lock = threading.Lock()
+
+
+
+    def _get(self, cls, name, help, labels, **options):
+        '''
+        Returns the metric for name and labels, creating it on first use.
+        '''
+        name = self.prefix + '_' + name if self.prefix else name
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self.metrics.get(key)
+            if metric is None:
+                metric = self.metrics[key] = cls(name, help, labels, **options)
+        return metric
+
+
+
+    def counter(self, name, help='', function=None, **labels):
+        '''
+        Counter for name and labels, function replaces the value when given.
+        '''
+        metric = self._get(Counter, name, help, labels)
+        if function is not None:
+            metric.function = function
+        return metric
+
+
+
+    def gauge(self, name, help='', function=None, **labels):
+        '''
+        Gauge for name and labels, function(), when given, is read at render.
+        '''
+        metric = self._get(Gauge, name, help, labels)
+        if function is not None:
+            metric.function = function
+        return metric
+
+
+
+    def histogram(self, name, help='', buckets=LATENCY_BUCKETS, **labels):
+        '''
+        Histogram for name and labels.
+        '''
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+
+
+    def stage(self, name):
+        '''
+        Reusable context manager timing the stage name into stage_seconds.
+        '''
+        stage = self.stages.get(name)
+        if stage is None:
+            histogram = self.histogram('stage_seconds', 'Seconds per call of each ingest stage',
+                                       stage=name)
+            stage = self.stages[name] = _Stage(histogram)
+        return stage
+
+
+
+    def profile(self, *stages, every=1):
+        '''
+        Profiles the named stages with cProfile, only every every-th call of
+        each is profiled to keep the overhead down.
+        '''
+        import cProfile
+
+        for name in stages:
+            stage = self.stage(name)
+            if stage.profiler is None:
+                stage.profiler = cProfile.Profile()
+            stage.every = every
+            stage.active = True
+
+
+
+    def stop_profiling(self, *stages):
+        '''
+        Stops profiling the named stages, all of them when none are named.
+        The collected profiles are kept.
+        '''
+        for name in stages or list(self.stages):
+            self.stages[name].active = False
+
+
+
+    def profile_stats(self, name):
+        '''
+        pstats.Stats of everything profiled in stage name.
+        '''
+        import pstats
+        return pstats.Stats(self.stages[name].profiler)
+
+
+
+    def render(self):
+        '''
+        All metrics in the Prometheus text exposition format.
+        '''
+        with self._lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+
+        lines = []
+        described = set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                if metric.help:
+                    lines.append('# HELP %s %s' % (metric.name, metric.help))
+                lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append(name + _labels(labels) + ' ' + _number(value))
+        return '\n'.join(lines) + '\n'
+
+
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        '''
+        Serves render() at http://host:port/metrics from a background thread.
+        '''
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='Metrics', daemon=True).start()
+        return self._server
+
+
+
+    def stop_serving(self):
+        '''
+        Stops the HTTP endpoint.
+        '''
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
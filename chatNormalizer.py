@@ -0,0 +1,137 @@
+#########################################################################################
+#                              Message normalization                                    #
+#########################################################################################
+# Normalization stage applied to chat messages on the way in, by default converting
+# emoji to their ':name:' text with emoji.demojize.
+#
+# Only the message field of a parsed line is normalized, never the IRC prefix.  Plain
+# ASCII messages cannot contain emoji so they skip the work entirely, everything else
+# goes through a bounded LRU cache keyed on the message text since emote spam repeats
+# the same messages over and over.
+#
+#   MessageNormalizer : Callable on a message string, normalize_message() applies it
+#                       to a ChatMessage.  stats() reports the ASCII skips and cache
+#                       hit rate.
+#
+# emoji is only imported when the first non-ASCII message needs it, so a bot that never
+# sees one (or has normalization turned off) starts without it.
+#
+# Twitch emote ranges (the emotes tag) are character offsets into the message.  When a
+# message has emotes only the text between them is normalized and the ranges, in the
+# tags and in the raw line, are moved to match, so emote_names() stays correct.
+#
+#
+#########################################################################################
+#########################################################################################
+
+
+
+from functools import lru_cache
+
+
+
+class MessageNormalizer:
+    def __init__(self, function=None, cacheSize=65536):
+        '''
+        - function maps a message string to its normalized form, emoji.demojize
+          when None.
+
+        - cacheSize bounds the LRU cache of normalized non-ASCII messages.
+        '''
+        self.function = function
+        self._cached = lru_cache(maxsize=cacheSize)(self._apply)
+        self.asciiSkips = 0
+
+
+
+    def _apply(self, text):
+        '''
+        Calls function, importing the default on first use.
+        '''
+        if self.function is None:
+            from emoji import demojize
+            self.function = demojize
+        return self.function(text)
+
+
+
+    def __call__(self, text):
+        '''
+        Returns the normalized form of text.
+        '''
+        if text.isascii():
+            self.asciiSkips += 1
+            return text
+        return self._cached(text)
+
+
+
+    def normalize_message(self, message):
+        '''
+        Returns the ChatMessage with only its message field normalized, the
+        raw line is rebuilt with the normalized message.
+        '''
+        if message.raw.isascii():
+            self.asciiSkips += 1
+            return message
+
+        emotes = message.emotes
+        if emotes:
+            return self._normalize_around(message, emotes)
+
+        # Tags can be non-ASCII when the message is not, so check the message itself
+        text = self(message.message)
+        if text is message.message or text == message.message:
+            return message
+
+        raw = message.raw[:len(message.raw) - len(message.message)] + text
+        return message._replace(raw=raw, message=text)
+
+
+
+    def _normalize_around(self, message, emotes):
+        '''
+        Normalizes the text between the emotes of message and moves the emote
+        ranges to where the emotes end up.
+        '''
+        original = message.message
+        pieces = []
+        ranges = {}
+        length = 0
+        position = 0
+        for emoteId, start, end in emotes:
+            text = self(original[position:start])
+            pieces.append(text)
+            length += len(text)
+            pieces.append(original[start:end])
+            ranges.setdefault(emoteId, []).append('%d-%d' % (length, length + end - start - 1))
+            length += end - start
+            position = end
+        pieces.append(self(original[position:]))
+
+        text = ''.join(pieces)
+        if text == original:
+            return message
+
+        value = '/'.join(emoteId + ':' + ','.join(spans) for emoteId, spans in ranges.items())
+        tags = dict(message.tags, emotes=value)
+
+        # The tag text is escaped, so only the emotes item is swapped
+        head = message.raw[:len(message.raw) - len(original)]
+        tagText, _, rest = head[1:].partition(' ')
+        items = [('emotes=' + value if item.startswith('emotes=') else item)
+                 for item in tagText.split(';')]
+        raw = '@' + ';'.join(items) + ' ' + rest + text
+        return message._replace(raw=raw, message=text, tags=tags)
+
+
+
+    def stats(self):
+        '''
+        Returns a dictionary of ASCII skips, cache hits/misses and hit rate.
+        '''
+        info = self._cached.cache_info()
+        lookups = info.hits + info.misses
+        return {'asciiSkips': self.asciiSkips, 'hits': info.hits, 'misses': info.misses,
+                'hitRate': info.hits / lookups if lookups else 0.0,
+                'cached': info.currsize}
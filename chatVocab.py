@@ -0,0 +1,139 @@
+#########################################################################################
+#                             Streaming word vocabulary                                 #
+#########################################################################################
+# Word and message counts for chat logs that can be built chunk by chunk, saved,
+# merged and updated as logs grow.
+#
+# Counts are kept in Counters which remember the order words were first seen.  A word's
+# index is its first-seen position among every word counted, so indices only depend on
+# the order chat was read in, new words always receive the next free index and an
+# update never renumbers a word.  Pruning of rare words (underUsed) is only applied by
+# export() and leaves gaps in the indices, the stored counts are never thrown away.
+#
+#   WordVocabulary : update() with messages, update_from_log() reads only what was
+#                    appended to a log since the last update, merge() another
+#                    vocabulary, save()/load() as JSON, export() lookup dictionaries.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import json
+from collections import Counter
+from processChat import read_records, records_to_dataframe, log_head, log_changed
+
+
+
+class WordVocabulary:
+    def __init__(self):
+        '''
+        Empty vocabulary, words counts words and messages counts the lowercased
+        messages of more than one word that the words were taken from.
+        '''
+        self.words = Counter()
+        self.messages = Counter()
+
+        # Byte offset and first bytes of every log read so far, keyed by path
+        self.logs = {}
+
+
+
+    def update(self, messages):
+        '''
+        Counts an iterable of message strings.
+        '''
+        words = self.words
+        counted = self.messages
+
+        for message in messages:
+            message = message.lower()
+            # Only take messages that have more than 1 word
+            if len(message.split()) > 1:
+                counted[message] += 1
+                # Only splits words at spaces, matching the original vocabulary
+                words.update(message.split(' '))
+
+
+
+    def update_from_log(self, logFile, includeTail=False):
+        '''
+        Counts the messages appended to logFile since it was last read, or the
+        whole log the first time.  A log that was truncated or recreated is read
+        from the start.  includeTail also counts a final unterminated record.
+        '''
+        key = os.path.abspath(logFile)
+        state = self.logs.get(key, {'offset': 0, 'head': ''})
+
+        head = log_head(logFile)
+        if log_changed(logFile, state['offset'], state['head'], head):
+            state = {'offset': 0, 'head': ''}
+
+        offset = state['offset']
+        for records, offset in read_records(logFile, state['offset'], includeTail=includeTail):
+            self.update(records_to_dataframe(records)['message'])
+
+        self.logs[key] = {'offset': offset, 'head': head}
+
+
+
+    def merge(self, other):
+        '''
+        Adds the counts of another WordVocabulary.
+        '''
+        self.words.update(other.words)
+        self.messages.update(other.messages)
+        for key, state in other.logs.items():
+            self.logs.setdefault(key, state)
+
+
+
+    def save(self, path):
+        '''
+        Writes the counts and log offsets to a JSON file.
+        '''
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'words': self.words, 'messages': self.messages, 'logs': self.logs}, f)
+        os.replace(path + '.tmp', path)
+
+
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Reads a vocabulary written by save(), an empty one if path is missing.
+        '''
+        vocab = cls()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            vocab.words = Counter(data['words'])
+            vocab.messages = Counter(data['messages'])
+            vocab.logs = data['logs']
+        return vocab
+
+
+
+    def export(self, underUsed=5):
+        '''
+        Returns the chatVocabulary() tuple: occurances sorted by use, enumerated
+        message and word dictionaries and their inverses.  Words used fewer than
+        underUsed times are left out.  Indices are first-seen positions over all
+        counted words, so they stay the same as the vocabulary grows.
+        '''
+        # Index before pruning so a rare word becoming common never shifts the others
+        wordVocab = {index : word for index, (word, count) in enumerate(self.words.items())
+                     if count >= underUsed}
+
+        # Sorted dictionary to show occurances, just to check for interest
+        occurances = sorted([(self.words[word], word) for word in wordVocab.values()],
+                            reverse=True)
+
+        messageVocab = {index : message for index, message in enumerate(self.messages)}
+
+        # Inverse dictionaries to go from a message or word value to the index key
+        message_to_index = {message : index for index, message in messageVocab.items()}
+        word_to_index = {word : index for index, word in wordVocab.items()}
+
+        return occurances, messageVocab, wordVocab, message_to_index, word_to_index
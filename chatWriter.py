@@ -0,0 +1,178 @@
+#########################################################################################
+#                               Background log writer                                   #
+#########################################################################################
+# Writes chat records to a #channel_chat.log from a dedicated thread.
+#
+# The receive loop only stamps a record and puts it on a bounded queue, the writer
+# thread formats records and writes them in batches, flushing once batchSize records
+# are waiting or flushInterval seconds have passed.  The global logging configuration
+# is never touched so several bots in one process can each log to their own file.
+#
+#   Methods:  - start : Opens the log file and starts the writer thread.
+#
+#             - write : Queues one raw chat line, blocks only if the queue is full.
+#
+#             - close : Writes everything still queued and stops the thread.
+#
+#             - depth / stats : Current queue depth and running totals.
+#
+# Records are written as 'asctime - line' followed by three newlines, the format read
+# by processChat.get_chat_dataframe().  onFlush, when given, is called on the writer
+# thread after every batch reaches the file.  It should only hand off work, such as
+# chatIndex.IndexUpdater.notify, an exception it raises is counted in flushErrors and
+# never stops the writer.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import threading
+import queue
+import time
+
+
+
+TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+
+
+
+class ChatWriter:
+    def __init__(self, logFile, maxQueue=10000, batchSize=500, flushInterval=1.0,
+                 onFlush=None):
+        '''
+        - maxQueue bounds the records waiting to be written, write() blocks
+          when it is reached rather than dropping chat.
+
+        - A batch is written once batchSize records are waiting or after
+          flushInterval seconds, whichever comes first.
+
+        - onFlush() is called after each batch is written.
+        '''
+        self.logFile = logFile
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.onFlush = onFlush
+
+        self._queue = queue.Queue(maxQueue)
+        self._thread = None
+
+        self.written = 0
+        self.batches = 0
+        self.maxDepth = 0
+        self.flushErrors = 0
+
+
+
+    def start(self):
+        '''
+        Starts the writer thread, records are appended to logFile.
+        '''
+        self._file = open(self.logFile, 'a', encoding='utf-8', newline='')
+        self._thread = threading.Thread(target=self._run, name='ChatWriter ' + self.logFile,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+
+
+    def write(self, line, stamp=None):
+        '''
+        Queues a raw chat line stamped with stamp (epoch seconds, default now).
+        '''
+        self._queue.put((time.time() if stamp is None else stamp, line))
+
+        depth = self._queue.qsize()
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+
+
+
+    @property
+    def depth(self):
+        '''
+        Number of records waiting to be written.
+        '''
+        return self._queue.qsize()
+
+
+
+    def stats(self):
+        '''
+        Returns a dictionary of queue depth and write totals.
+        '''
+        return {'depth': self.depth, 'maxDepth': self.maxDepth,
+                'written': self.written, 'batches': self.batches,
+                'flushErrors': self.flushErrors}
+
+
+
+    def close(self):
+        '''
+        Writes every queued record, then stops the thread and closes the file.
+        '''
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+
+
+    def _flush(self, batch):
+        '''
+        Formats and writes a batch of records in one call.
+        '''
+        if not batch:
+            return
+
+        lines = []
+        lastSecond = None
+        for stamp, line in batch:
+            # Chat arrives many records per second, format each second once
+            second = int(stamp)
+            if second != lastSecond:
+                lastSecond = second
+                asctime = time.strftime(TIME_FORMAT, time.localtime(second))
+            lines.append(asctime + ' - ' + line + '\n\n\n')
+
+        self._file.write(''.join(lines))
+        self._file.flush()
+
+        self.written += len(batch)
+        self.batches += 1
+
+        if self.onFlush is not None:
+            try:
+                self.onFlush()
+            except Exception:
+                # Whatever onFlush does must not stop the log being written
+                self.flushErrors += 1
+
+
+
+    def _run(self):
+        '''
+        Writer thread, collects records into batches until close().
+        '''
+        batch = []
+        deadline = time.monotonic() + self.flushInterval
+
+        while True:
+            try:
+                record = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                record = False
+
+            if record is None:
+                self._flush(batch)
+                return
+
+            if record is not False:
+                batch.append(record)
+
+            if len(batch) >= self.batchSize or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flushInterval
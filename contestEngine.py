@@ -0,0 +1,177 @@
+#########################################################################################
+#                                 Contest engine                                        #
+#########################################################################################
+# Runs any number of chat contests at once against every parsed chat line.
+#
+# All active phrases are compiled into KeywordMatchers (one for case sensitive and one
+# for case insensitive contests) so each message is scanned once no matter how many
+# contests are running.  Only contests whose phrase was found do any further work,
+# such as the whole word check.
+#
+#   Contest : One phrase with its own number of winners and matching options.
+#
+#   ContestEngine : add() / remove() contests, check() every message, winners are
+#                   announced through onWinner and kept on their Contest.
+#
+# Every Winner records the server timestamp of the message (when the server sends
+# one), when the line was received and when the win was announced, so the latency
+# from receipt to announcement can be checked under load.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import re
+import time
+import threading
+from collections import namedtuple
+from voteTally import KeywordMatcher
+
+
+
+Winner = namedtuple('Winner', ['contest', 'username', 'message', 'serverTime',
+                               'received', 'announced', 'latency'])
+
+
+
+class Contest:
+    def __init__(self, phrase, winners=1, ignoreCase=False, wholeWord=False, name=None):
+        '''
+        - winners is the number of winners before the contest closes.
+
+        - ignoreCase matches the phrase in any case, wholeWord only matches it
+          when it is not part of a longer word.
+        '''
+        self.phrase = phrase
+        self.winners = winners
+        self.ignoreCase = ignoreCase
+        self.wholeWord = wholeWord
+        self.name = phrase if name is None else name
+
+        self.found = []
+        self.done = threading.Event()
+
+        flags = re.IGNORECASE if ignoreCase else 0
+        self._wordPattern = re.compile(r'(?<!\w)' + re.escape(phrase) + r'(?!\w)', flags)
+
+
+
+    def matches(self, text):
+        '''
+        Full check of text, only needed for wholeWord contests once the
+        matcher has found the phrase somewhere in it.
+        '''
+        if self.wholeWord == True:
+            return self._wordPattern.search(text) is not None
+        if self.ignoreCase == True:
+            return self.phrase.lower() in text.lower()
+        return self.phrase in text
+
+
+
+def announce(winner):
+    '''
+    Default onWinner, prints the winner.
+    '''
+    print('\n\nWe have a winner :  ' + winner.username + '  : ' + winner.message)
+
+
+
+class ContestEngine:
+    def __init__(self, onWinner=announce, uniqueWinners=True):
+        '''
+        - onWinner(winner) is called for every Winner as it is found.
+
+        - uniqueWinners lets a user win each contest only once.
+        '''
+        self.onWinner = onWinner
+        self.uniqueWinners = uniqueWinners
+        self.contests = []
+        self._build()
+
+
+
+    def add(self, contest):
+        '''
+        Starts a Contest, returns it.
+        '''
+        self.contests.append(contest)
+        self._build()
+        return contest
+
+
+
+    def remove(self, contest):
+        '''
+        Stops a Contest.
+        '''
+        self.contests.remove(contest)
+        self._build()
+
+
+
+    def _build(self):
+        '''
+        Compiles the matchers over the phrases of the open contests.
+        '''
+        self._exact = [contest for contest in self.contests
+                       if not contest.ignoreCase and not contest.done.is_set()]
+        self._folded = [contest for contest in self.contests
+                        if contest.ignoreCase and not contest.done.is_set()]
+        self._exactMatcher = KeywordMatcher([contest.phrase for contest in self._exact])
+        self._foldedMatcher = KeywordMatcher([contest.phrase.lower() for contest in self._folded])
+
+
+
+    @property
+    def active(self):
+        '''
+        True while any contest is still open.
+        '''
+        return len(self._exact) + len(self._folded) > 0
+
+
+
+    def check(self, message):
+        '''
+        Checks one ChatMessage against every open contest and returns the
+        list of Winners it produced.
+        '''
+        if message.command != 'PRIVMSG' or not self.active:
+            return []
+
+        text = message.message
+        hits = [self._exact[i] for i in self._exactMatcher.find(text)]
+        if self._folded:
+            hits += [self._folded[i] for i in self._foldedMatcher.find(text.lower())]
+
+        winners = []
+        closed = False
+        for contest in hits:
+            if contest.done.is_set():
+                continue
+            if contest.wholeWord == True and not contest.matches(text):
+                continue
+            if self.uniqueWinners == True and any(win.username == message.username
+                                                  for win in contest.found):
+                continue
+
+            received = message.received if message.received is not None else time.time()
+            winner = Winner(contest.name, message.username, text, message.serverTime, received,
+                            None, None)
+            if self.onWinner is not None:
+                self.onWinner(winner)
+            announced = time.time()
+            winner = winner._replace(announced=announced, latency=announced - received)
+
+            contest.found.append(winner)
+            winners.append(winner)
+            if len(contest.found) >= contest.winners:
+                contest.done.set()
+                closed = True
+
+        if closed:
+            self._build()
+
+        return winners
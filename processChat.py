@@ -3,74 +3,506 @@
 # Collection of functions to process raw Twitch Chat Data.
 
 # The fucntion get_chat_dataframe() is used in the Twitch Chat bot to load data from the
-# .log file into a pandas dataframe.
+# .log file into a pandas dataframe.  The log is read in binary chunks and each chunk of
+# records is parsed with one compiled pattern and a single vectorized timestamp
+# conversion, a chunkSize can be given to iterate over the log one dataframe at a time.
+
+# read_record_spans() gives the byte position of every record, which is what
+# chatIndex.ChatIndex stores to read single messages back without parsing the log.
+
+# Logs only ever grow by appending, so update_chat_dataframe() keeps a checkpoint next
+# to the log (the byte offset parsed so far plus the parsed results, merged into a
+# handful of parts) and only parses records added since the last call.  follow_chat()
+# streams new records as they are written, like 'tail -f'.
+
+# Usernames and channels are interned while parsing so the dataframe columns share one
+# string per name.  parse_records() gives compact chatMessage.ChatRecord objects with
+# integer timestamps instead of a dataframe, this is what chatIndex and chatArchive
+# work with.  records_to_columns() converts a list of them to numpy columns in bulk
+# and columns_to_dataframe() builds the usual dataframe, as ChatIndex.search_dataframe()
+# does.  Whole logs are still parsed straight into a dataframe by records_to_dataframe(),
+# one vectorized timestamp conversion is faster than building a record per message.
+
+# get_chat_dataframe() also reads columnar archives written by chatArchive.ChatArchive,
+# pass the archive directory and a start/end/channels range to only open the segments
+# covering that range.
 
 # Other functions are for ways of processing this data and generating vocabularies for 
 # use in a Recurrent Neural Network.  
 
 # Most notably the 'clean' functions will read through raw chat data and remove 
 # non-standard characters.  This 'cleaning' is necessary for the data to be useable in 
-# the Text Generation RNN.
+# the Text Generation RNN.  clean_chat() does this in a single streaming pass and can
+# split a large log into byte ranges cleaned in parallel by a process pool.
 
 #########################################################################################
 
 
+import sys
 import time
+import calendar
 import os
+import json
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from datetime import datetime
 import re
 import string
+from chatMessage import ChatRecord
 
 
 
 
-def get_chat_dataframe(logFile):
+# Records are written as 'asctime - raw irc line' followed by three newlines.  Logs written
+# on Windows end lines with '\r\n' so any mix of three line endings separates records.
+RECORD_SEPARATOR = re.compile(b'(?:\r\n|\r(?!\n)|\n){3}')
+TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+COLUMNS = ['dt', 'channel', 'username', 'message']
+
+# Type of the 'dt' column, the unit pandas gives parsed log timestamps
+DT_DTYPE = pd.to_datetime(['2000-01-01_00:00:00'], format=TIME_FORMAT).dtype
+
+# Timestamp and the first PRIVMSG in a record, older logs can hold several lines per record
+RECORD_PATTERN = re.compile(
+    r'\s*(\S+) - .*?:([^!\s]+)![^@\s]*@\S+\.tmi\.twitch\.tv PRIVMSG #(\S+) :([^\r\n]*)',
+    re.DOTALL)
+
+# Bytes read from the log per chunk
+READ_SIZE = 1 << 22
+
+# Any character outside string.printable marks a message as non-standard
+NON_PRINTABLE = re.compile('[^' + re.escape(string.printable) + ']')
+
+# Bytes of log handed to each worker by clean_chat
+RANGE_SIZE = 1 << 26
+
+# Checkpoint parts loaded by update_chat_dataframe(), keyed by checkpoint then part
+_checkpoints = {}
+
+
+
+
+def _read_blocks(logFile, offset=0, readSize=READ_SIZE, stop=None):
+    '''
+    Generator over logFile from byte offset in reads of readSize bytes, ending
+    at byte stop when it is given.
+
+    Yields (data, base, end) where data starts at byte base of the log and
+    data[:end] holds only complete records.  data[end:] is carried into the
+    next block, after the last block it is the unterminated tail of the log.
+    '''
+    with open(logFile, 'rb') as f:
+        f.seek(offset)
+        position = offset
+        tail = b''
+
+        while True:
+            size = readSize if stop is None else min(readSize, stop - position)
+            block = f.read(size) if size > 0 else b''
+            if len(block) == 0:
+                break
+            position += len(block)
+
+            # Never leave a '\r\n' split across two reads
+            if block.endswith(b'\r') and position != stop:
+                block += f.read(1)
+                position += 1
+
+            data = tail + block
+
+            # Find the end of the last complete record
+            if b'\r' in data:
+                end = 0
+                for match in RECORD_SEPARATOR.finditer(data):
+                    end = match.end()
+            else:
+                end = data.rfind(b'\n\n\n') + 3 if b'\n\n\n' in data else 0
+
+            yield data, offset, end
+
+            tail = data[end:]
+            offset += end
+
+
+
+
+def read_records(logFile, offset=0, readSize=READ_SIZE, includeTail=False, stop=None):
+    '''
+    Generator over the complete records of logFile starting at byte offset.
+
+    Yields (records, end) where records is a list of decoded record strings and
+    end is the byte offset just past the last complete record.  A trailing
+    record without its separator is left for a later read unless includeTail.
+    Reading ends at byte stop when it is given.
+    '''
+    tail = b''
+    for data, base, end in _read_blocks(logFile, offset, readSize, stop):
+        tail = data[end:]
+        offset = base + end
+        if end == 0:
+            continue
+
+        # Decode and split once per block
+        body = data[:end]
+        if b'\r' in body:
+            body = body.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        records = body.decode('utf-8', errors='replace').split('\n\n\n')
+        records.pop()
+        yield records, offset
+
+    if includeTail == True and tail.strip():
+        yield [tail.decode('utf-8', errors='replace')], offset + len(tail)
+
+
+
+
+def read_record_spans(logFile, offset=0, readSize=READ_SIZE, stop=None):
+    '''
+    Generator like read_records() over the complete records of logFile, but
+    yields (spans, end) where spans is a list of (start, length, record) giving
+    each record's byte position in the log.  Used to index a log, a record can
+    later be read back on its own with f.seek(start) and f.read(length).
+    '''
+    finditer = RECORD_SEPARATOR.finditer
+    for data, base, end in _read_blocks(logFile, offset, readSize, stop):
+        if end == 0:
+            continue
+
+        spans = []
+        start = 0
+        for match in finditer(data, 0, end):
+            spans.append((base + start, match.start() - start,
+                          data[start:match.start()].decode('utf-8', errors='replace')))
+            start = match.end()
+
+        yield spans, base + end
+
+
+
+
+def records_to_dataframe(records):
+    '''
+    Parses a list of record strings into a dataframe with COLUMNS, records that
+    are not timestamped chat messages are dropped.
+    '''
+    match = RECORD_PATTERN.match
+    rows = [found.groups() for found in map(match, records) if found is not None]
+    if not rows:
+        chat = pd.DataFrame(columns=COLUMNS)
+        chat['dt'] = pd.to_datetime(chat['dt'], format=TIME_FORMAT)
+        return chat
+
+    stamps, usernames, channels, messages = zip(*rows)
+
+    intern = sys.intern
+    chat = pd.DataFrame({'dt': pd.to_datetime(list(stamps), format=TIME_FORMAT, errors='coerce'),
+                         'channel': list(map(intern, channels)),
+                         'username': list(map(intern, usernames)),
+                         'message': list(messages)})
+
+    return chat.dropna().reset_index(drop=True)
+
+
+
+
+@lru_cache(maxsize=1024)
+def _day_seconds(day):
+    '''
+    Local wall clock seconds at the start of a 'YYYY-mm-dd' day.
+    '''
+    return calendar.timegm(time.strptime(day, '%Y-%m-%d'))
+
+
+
+def stamp_seconds(stamp):
+    '''
+    Converts a TIME_FORMAT log timestamp to integer local wall clock seconds,
+    raises ValueError when it is not one.
+    '''
+    day, _, clock = stamp.partition('_')
+    hours, minutes, seconds = clock.split(':')
+    return _day_seconds(day) + int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+
+def parse_record(record):
+    '''
+    Parses one record string into a ChatRecord, None when it is not a
+    timestamped chat message.
+    '''
+    found = RECORD_PATTERN.match(record)
+    if found is None:
+        return None
+    stamp, username, channel, message = found.groups()
+    try:
+        seconds = stamp_seconds(stamp)
+    except ValueError:
+        return None
+
+    return ChatRecord(seconds, channel, username, message)
+
+
+
+def parse_records(records):
+    '''
+    Parses a list of record strings into a list of ChatRecords, records that
+    are not timestamped chat messages are dropped.
+    '''
+    parsed = map(parse_record, records)
+    return [record for record in parsed if record is not None]
+
+
+
+def iter_chat_records(logFile, offset=0):
+    '''
+    Generator over every ChatRecord in logFile from byte offset.
+    '''
+    for records, _ in read_records(logFile, offset, includeTail=True):
+        yield from parse_records(records)
+
+
+
+def records_to_columns(chatRecords):
+    '''
+    Converts a list of ChatRecords into a dictionary of numpy columns, 'dt'
+    as int64 seconds and object arrays sharing the records' strings.
+    '''
+    count = len(chatRecords)
+    columns = {'dt': np.fromiter((record.dt for record in chatRecords), np.int64, count)}
+    for name in COLUMNS[1:]:
+        column = np.empty(count, dtype=object)
+        column[:] = [getattr(record, name) for record in chatRecords]
+        columns[name] = column
+
+    return columns
+
+
+
+def columns_to_dataframe(columns):
+    '''
+    Builds a dataframe with COLUMNS from records_to_columns() columns.
+    '''
+    chat = pd.DataFrame({name: columns[name] for name in COLUMNS[1:]})
+    chat.insert(0, 'dt', columns['dt'].astype('datetime64[s]').astype(DT_DTYPE))
+    return chat
+
+
+
+
+def iter_chat_dataframe(logFile, chunkSize=100000):
+    '''
+    Generator over logFile yielding dataframes of roughly chunkSize records.
+    '''
+    pending = []
+    for records, _ in read_records(logFile, includeTail=True):
+        pending.extend(records)
+        if len(pending) >= chunkSize:
+            yield records_to_dataframe(pending)
+            pending = []
+
+    if pending:
+        yield records_to_dataframe(pending)
+
+
+
+
+
+def get_chat_dataframe(logFile, chunkSize=None, incremental=False,
+                       start=None, end=None, channels=None):
     '''
     Loads the current #channel_chat.log file and returns a pandas dataframe.
+
+    When chunkSize is given an iterator of dataframes with chunkSize records
+    each is returned instead, see iter_chat_dataframe().  incremental only
+    parses records added since the last incremental call, see
+    update_chat_dataframe().
+
+    logFile can also be a ChatArchive directory.  start, end and channels
+    limit the rows returned, for an archive only matching segments are read.
+    '''
+    if os.path.isdir(logFile):
+        from chatArchive import ChatArchive
+        return ChatArchive(logFile).read(start, end, channels)
+
+    if chunkSize is not None:
+        return iter_chat_dataframe(logFile, chunkSize)
+
+    if incremental == True:
+        chat = update_chat_dataframe(logFile)
+    else:
+        frames = [records_to_dataframe(records)
+                  for records, _ in read_records(logFile, includeTail=True)]
+        chat = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+    if start is not None:
+        chat = chat[chat['dt'] >= pd.Timestamp(start)]
+    if end is not None:
+        chat = chat[chat['dt'] <= pd.Timestamp(end)]
+    if channels is not None:
+        chat = chat[chat['channel'].isin([channel.lstrip('#') for channel in channels])]
+
+    return chat.reset_index(drop=True)
+
+
+
+
+def log_head(logFile, size=256):
+    '''
+    First bytes of logFile, used to notice a log that was deleted and recreated.
+    '''
+    with open(logFile, 'rb') as f:
+        return f.read(size).decode('utf-8', errors='replace')
+
+
+
+def log_changed(logFile, offset, oldHead, head=None):
+    '''
+    True when logFile was truncated or recreated since it was read up to byte
+    offset with oldHead as its log_head().  head is the current log_head() if
+    the caller already has it.
     '''
-    data = []
+    if head is None:
+        head = log_head(logFile)
+    return os.path.getsize(logFile) < offset or not head.startswith(oldHead)
+
 
-    with open(logFile, 'r', encoding='utf-8') as f:
-        lines = f.read().split('\n\n\n')
-        # Go through lines and extract data by splitting strings appropriately 
-        for line in lines:
-            try:
-                time_logged = line.split(' - ')[0].strip()
-                time_logged = datetime.strptime(time_logged, '%Y-%m-%d_%H:%M:%S')
 
-                username_message = line.split(' - ')[1:]
-                username_message = ''.join(username_message).strip()
 
-                username, channel, message = re.search(
-                    ':(.*)\\!.*@.*\\.tmi\\.twitch\\.tv PRIVMSG #(.*) :(.*)',
-                    username_message).groups()
+def _save_part(checkpoint, state, frame):
+    '''
+    Pickles frame as the next part of checkpoint and records it in state.
+    '''
+    part = 'part-%05d.pkl' % state['next']
+    state['next'] += 1
+    frame.to_pickle(os.path.join(checkpoint, part))
+    state['parts'].append(part)
+    state['rows'].append(len(frame))
+
 
-                d = {
-                    'dt': time_logged,
-                    'channel': channel,
-                    'username': username,
-                    'message': message
-                    }
 
-                data.append(d)
 
-            except Exception:
-                pass
+def update_chat_dataframe(logFile, checkpoint=None):
+    '''
+    Returns the full dataframe for logFile while only parsing records appended
+    since the previous call.
+
+    The checkpoint directory (default logFile + '.ckpt') holds state.json with
+    the byte offset parsed so far and pickled dataframe parts.  Each update
+    adds a part for the new records, then merges the newest parts while the
+    one before is no bigger than the last, like a binary counter, so there are
+    only about log2(updates) parts and every row is rewritten a few times at
+    most.  Parts already loaded are kept in memory for the next call in the
+    same process.  The checkpoint is discarded if the log was truncated or
+    recreated.
+    '''
+    if checkpoint is None:
+        checkpoint = logFile + '.ckpt'
+    stateFile = os.path.join(checkpoint, 'state.json')
+
+    state = {'offset': 0, 'head': '', 'parts': []}
+    if os.path.exists(stateFile):
+        with open(stateFile, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+    head = log_head(logFile)
+    if log_changed(logFile, state['offset'], state['head'], head):
+        for part in state['parts']:
+            os.remove(os.path.join(checkpoint, part))
+        # Part names are never reused, so a part loaded before is never stale
+        state = {'offset': 0, 'head': '', 'parts': [], 'rows': [],
+                 'next': state.get('next', len(state['parts']))}
+
+    # Reuse the parts loaded by the last call unless the checkpoint changed since
+    loaded = _checkpoints.get(checkpoint, {})
+    frames = [loaded.get(part) for part in state['parts']]
+    frames = [pd.read_pickle(os.path.join(checkpoint, part)) if frame is None else frame
+              for part, frame in zip(state['parts'], frames)]
+
+    # Checkpoints written before parts were merged have no row counts or counter
+    state.setdefault('rows', [len(frame) for frame in frames])
+    state.setdefault('next', len(state['parts']))
+
+    # Parse only what was appended after the checkpoint
+    new = []
+    offset = state['offset']
+    for records, offset in read_records(logFile, state['offset']):
+        chat = records_to_dataframe(records)
+        if len(chat) > 0:
+            new.append(chat)
+
+    if offset > state['offset']:
+        os.makedirs(checkpoint, exist_ok=True)
+        removed = []
+        if new:
+            frames.append(pd.concat(new, ignore_index=True))
+            _save_part(checkpoint, state, frames[-1])
+
+            while len(frames) > 1 and state['rows'][-2] <= state['rows'][-1]:
+                removed += state['parts'][-2:]
+                merged = pd.concat(frames[-2:], ignore_index=True)
+                del frames[-2:], state['parts'][-2:], state['rows'][-2:]
+                frames.append(merged)
+                _save_part(checkpoint, state, merged)
+
+        state['offset'] = offset
+        state['head'] = head
+
+        # The new state goes in before merged parts are deleted
+        with open(stateFile + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(stateFile + '.tmp', stateFile)
+        for part in removed:
+            os.remove(os.path.join(checkpoint, part))
+
+    _checkpoints[checkpoint] = dict(zip(state['parts'], frames))
+
+    if len(frames) == 0:
+        return pd.DataFrame(columns=COLUMNS)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+
+
+def follow_chat(logFile, fromStart=False, interval=1.0):
+    '''
+    Generator yielding a dataframe of new records each time logFile grows,
+    waiting interval seconds between checks.  Starts at the current end of the
+    log unless fromStart.  Runs until the caller stops iterating.
+    '''
+    offset = 0
+    if fromStart == False and os.path.exists(logFile):
+        offset = os.path.getsize(logFile)
+
+    while True:
+        if os.path.exists(logFile) and os.path.getsize(logFile) < offset:
+            offset = 0
+
+        found = False
+        if os.path.exists(logFile):
+            for records, offset in read_records(logFile, offset):
+                chat = records_to_dataframe(records)
+                found = True
+                if len(chat) > 0:
+                    yield chat
 
-    return pd.DataFrame().from_records(data)
+        if found == False:
+            time.sleep(interval)
 
 
 
 
-def characterVocab(logFile):
+def characterVocab(logFile, incremental=False):
     '''
     Opens all messages and writes them to a separate file for storage on 
     new lines in a single string.  Character vocab is created and lookup
-    dictionaries are returned.
+    dictionaries are returned.  incremental reuses the log checkpoint.
+
+    For large logs chatCorpus.export_corpus() writes the same character
+    encoding to memory-mapped shards without building the string.
     '''
-    messages = get_chat_dataframe(logFile).values[:,2]
+    messages = get_chat_dataframe(logFile, incremental=incremental)['message']
 
     # Writing to allChat.txt to just keep a running file
     with open('allChat.txt', 'w', encoding='utf-8') as file:
@@ -90,45 +522,108 @@ def characterVocab(logFile):
 
 
 
-def clean_messages(logFile, chatText):
+def clean_lines(chat, withUsers):
     '''
-    Scans through logFile and discards messages that use 
-    non-standard characters
+    Returns the text written for the standard character messages of chat.
+    '''
+    search = NON_PRINTABLE.search
+    keep = [search(message) is None for message in chat['message']]
+    chat = chat[keep]
+    if len(chat) == 0:
+        return ''
+
+    lines = chat['username'] + ': ' + chat['message'] if withUsers else chat['message']
+    return '\n'.join(lines) + '\n'
+
+
+
+
+def clean_blocks(logFile, start, stop, withUsers):
+    '''
+    Generator of cleaned text for the records between two byte offsets.
+    '''
+    for records, _ in read_records(logFile, start, includeTail=True, stop=stop):
+        yield clean_lines(records_to_dataframe(records), withUsers)
+
+
+
+
+def _clean_range(logFile, start, stop, withUsers):
+    '''
+    Worker for clean_chat, returns the cleaned text of one byte range.
+    '''
+    return ''.join(clean_blocks(logFile, start, stop, withUsers))
+
+
+
+
+def _record_ranges(logFile, rangeSize=RANGE_SIZE):
+    '''
+    Splits logFile into (start, stop) byte ranges of about rangeSize that
+    each begin on a record boundary.
+    '''
+    size = os.path.getsize(logFile)
+    bounds = [0]
+
+    with open(logFile, 'rb') as f:
+        for guess in range(rangeSize, size, rangeSize):
+            if guess <= bounds[-1]:
+                continue
+            f.seek(guess)
+            data = f.read(1 << 20)
+            match = RECORD_SEPARATOR.search(data)
+            if match is not None:
+                bounds.append(guess + match.end())
+
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+
+
+def clean_chat(logFile, chatText, withUsers=False, processes=None, incremental=False):
+    '''
+    Writes the messages of logFile that only use standard characters to
+    chatText, one per line, as 'username: message' when withUsers.
+
+    The log is parsed once and written as it is cleaned.  processes > 1 splits
+    the log into byte ranges cleaned by a process pool, output keeps log order.
+    incremental loads the log through its checkpoint instead.
     '''
-    messages = get_chat_dataframe(logFile).values[:,3]
-    
     with open(chatText, 'w', encoding='utf-8') as file:
-        for message in messages:
-            skip = False
-            for character in list(message):
-                if character not in string.printable:
-                    skip = True
-                    break
+        if incremental == True:
+            file.write(clean_lines(update_chat_dataframe(logFile), withUsers))
 
-            if skip == False:
-                file.write(message + '\n')
+        elif processes is not None and processes > 1:
+            starts, stops = zip(*_record_ranges(logFile))
+            with ProcessPoolExecutor(processes) as pool:
+                for text in pool.map(_clean_range, [logFile] * len(starts), starts, stops,
+                                     [withUsers] * len(starts)):
+                    file.write(text)
 
+        else:
+            for text in clean_blocks(logFile, 0, None, withUsers):
+                file.write(text)
 
 
 
-def clean_messages_with_users(logFile, chatText):
+
+def clean_messages(logFile, chatText, incremental=False, processes=None):
     '''
     Scans through logFile and discards messages that use 
-    non-standard characters
+    non-standard characters.  incremental reuses the log checkpoint.
     '''
-    users = get_chat_dataframe(logFile).values[:,2]
-    messages = get_chat_dataframe(logFile).values[:,3]
-    
-    with open(chatText, 'w', encoding='utf-8') as file:
-        for username, message in zip(users, messages):
-            skip = False
-            for character in list(message):
-                if character not in string.printable:
-                    skip = True
-                    break
+    clean_chat(logFile, chatText, False, processes, incremental)
 
-            if skip == False:
-                file.write(username + ': ' + message + '\n')
+
+
+
+def clean_messages_with_users(logFile, chatText, incremental=False, processes=None):
+    '''
+    Scans through logFile and discards messages that use 
+    non-standard characters.  incremental reuses the log checkpoint.
+    '''
+    clean_chat(logFile, chatText, True, processes, incremental)
 
 
 
@@ -152,51 +647,26 @@ def clean_characterVocab(chatText):
 
 
 
-def chatVocabulary(logFile, underUsed=5):
+def chatVocabulary(logFile, underUsed=5, incremental=False):
     '''
     Returns a sorted list of tuples showing word usage in descending order.
 
     Also returns enumerated dictionaries for messages and words as well as
     inverse dictionaries allowing to go from index -> word -> index using 
-    two dictionary calls.
-    '''
-    messages = get_chat_dataframe(logFile).values[:,2]
-
-    wordVocab = dict()
-    messageVocab = list()
-
-    for message in messages:
-        message = message.lower()
-        # Only take messages that have more than 1 word
-        if len(message.split()) > 1:
-            messageVocab.append(message)
-
-            # Only splits words at spaces, could look at using regex to split at commas, peroids, etc.
-            for word in message.split(' '):
-                try:
-                    wordVocab[word] += 1
-                except:
-                    wordVocab[word] = 1
-
-    # Remove underused words
-    allWords = set(wordVocab)
-    for word in allWords:
-        if wordVocab[word] < underUsed:
-            del wordVocab[word]
-
-    # Sorted dictionary to show occurances, just to check for interest
-    occurances = sorted([(value, key) for (key,value) in wordVocab.items()], reverse=True)
-
-    # Make messageVocab an enumerated dictionary
-    messageVocab = {index : message for index, message in enumerate(set(messageVocab))}
-
-    # Change wordVocab from a dictionary of occurance to enumerated values
-    wordVocab = {index : word for index, word in enumerate(set(wordVocab))}
-    
-    # Inverse dictionaries to go from a message or word value to the index key
-    message_to_index = {message : index for index, message in messageVocab.items()}
-    word_to_index = {word : index for index, word in wordVocab.items()}
-
-    return occurances, messageVocab, wordVocab, message_to_index, word_to_index
-
+    two dictionary calls.  Indices follow the order words first appear.
 
+    incremental keeps the counts in logFile + '.vocab.json' and only reads
+    what was appended to the log since the last call, see chatVocab.
+    '''
+    from chatVocab import WordVocabulary
+
+    if incremental == True:
+        vocabFile = logFile + '.vocab.json'
+        vocab = WordVocabulary.load(vocabFile)
+        vocab.update_from_log(logFile)
+        vocab.save(vocabFile)
+    else:
+        vocab = WordVocabulary()
+        vocab.update_from_log(logFile, includeTail=True)
+
+    return vocab.export(underUsed)
@@ -8,18 +8,26 @@
 # but for single user the default information is ok.  Once a channel has been selected
 # input a choice from the selection below:
 #
-# Choices: ['Read Chat', 'Write Chat', 'Count Votes', 'Contest', 'Change Socket', 'Quit']
+# Choices: ['Read Chat', 'Write Chat', 'Write Channels', 'Count Votes', 'Contest',
+#           'Run Together', 'Change Socket', 'Quit']
 #
 #     - Read Chat reads and displays live twitch chat from the selected channel
 #
 #     - Write Chat writes chat to a file with an option for displaying live chat
 #
+#     - Write Channels logs several channels at once, each to its own #channel_chat.log,
+#       using the multi-channel ChatEngine.
+#
 #     - Count votes stores chat data over a runtime and compares inputs to a library
 #       of keywords and tallies votes by unique user or total votes.
 #
 #     - Contest uses an input string and reads incoming chat until a matching message
 #       is found.
 #
+#     - Run Together reads chat once and runs any mix of logging, vote counting, a
+#       contest, live activity tracking (rates, chatters, hype spikes) and displaying
+#       chat at the same time.
+#
 #     - Change Socket allows the bot to change nickname and channel
 #
 #     - Quit will close the bot
@@ -30,6 +38,10 @@
 
 
 from twitchChatBot import ChatBot
+from chatEngine import ChatEngine
+from chatDispatcher import (ChatDispatcher, LogHandler, VoteHandler, ContestHandler,
+                            PrintHandler)
+from chatAnalytics import ChatAnalytics
 import os
 
 
@@ -86,8 +98,10 @@ if __name__ == '__main__':
     while True:
         # Input a task
         while True:
-            choices = ['Read Chat', 'Write Chat', 'Count Votes', 'Contest', 'Change Socket', 'Quit']
-            pick = input('\nRead Chat, Write Chat, Count Votes, Contest, Change Socket, or Quit?  ')
+            choices = ['Read Chat', 'Write Chat', 'Write Channels', 'Count Votes', 'Contest',
+                       'Run Together', 'Change Socket', 'Quit']
+            pick = input('\nRead Chat, Write Chat, Write Channels, Count Votes, Contest, '
+                         'Run Together, Change Socket, or Quit?  ')
             if pick in choices:
                 break
         
@@ -107,8 +121,51 @@ if __name__ == '__main__':
 
         elif pick == 'Read Chat':
             bot.read_chat()
+
+        elif pick == 'Write Channels':
+            channels = input('\nInput channels separated by commas: ')
+            channels = [channel.strip() for channel in channels.split(',') if channel.strip()]
+            runtime = int(input('\nInput runtime in seconds: '))
+            engine = ChatEngine(bot.nickname, channels, bot.server, bot.port, bot.token)
+            engine.run_sync(runtime)
         
-        if pick not in ['Quit', 'Change Socket', 'Read Chat']:
+        elif pick == 'Run Together':
+            dispatcher = ChatDispatcher()
+            votes = contest = analytics = None
+
+            if input('\nLog chat (Y/N): ').lower() == 'y':
+                dispatcher.register(LogHandler(bot.logFile))
+            if input('\nCount votes (Y/N): ').lower() == 'y':
+                voteLibrary = input('\nSpecify file for voteLibrary: ')
+                uniqueUsers = input('\nCount unique user votes (Y/N): ').lower() == 'y'
+                votes = dispatcher.register(VoteHandler(voteLibrary, uniqueUsers))
+            if input('\nRun a contest (Y/N): ').lower() == 'y':
+                contest = dispatcher.register(ContestHandler(input('\nInput the winning phrase: ')))
+            if input('\nTrack chat activity (Y/N): ').lower() == 'y':
+                analytics = dispatcher.register(ChatAnalytics(), dropWhenFull=True)
+
+            # Showing chat replaces the progress counter, as in the other choices
+            showProgress, showChat = show()
+            if showChat == True:
+                dispatcher.register(PrintHandler(), dropWhenFull=True)
+
+            runtime = int(input('\nInput runtime in seconds: '))
+            bot.run(dispatcher, runtime, showProgress)
+
+            if votes is not None:
+                talliedVotes = votes.results()
+                for key in talliedVotes:
+                    print(key + ' :  %d' % talliedVotes[key])
+            if contest is not None and len(contest.found) == 0:
+                print('\nNo winner found')
+            if analytics is not None:
+                for activity in analytics.snapshot(5).values():
+                    print('\n#%s :  %.1f messages/s, ~%d chatters, %d spikes'
+                          % (activity['channel'], activity['rate'], activity['chatters'],
+                             activity['spikes']))
+                    print('Top words :  ' + ', '.join(word for word, _ in activity['topWords']))
+
+        if pick not in ['Quit', 'Change Socket', 'Read Chat', 'Write Channels', 'Run Together']:
             # Assign showProgress, showChat for following methods
             showProgress, showChat = show()
 
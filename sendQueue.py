@@ -0,0 +1,196 @@
+#########################################################################################
+#                               Outbound send queue                                     #
+#########################################################################################
+# Paces everything the bot sends to Twitch so it never trips the server rate limits.
+#
+#   SlidingWindow : Remembers the last capacity send times and only allows another
+#                   line once the oldest is more than per seconds old, so no window of
+#                   per seconds ever holds more than capacity lines.  A token bucket
+#                   that starts full and refills continuously lets nearly twice
+#                   capacity through in one window, which Twitch punishes.
+#
+#   SendQueue : Background thread that owns all writes to the socket.  PRIVMSG lines
+#               go through the message window, JOIN lines through the join window and
+#               anything else (PONG, CAP, PART) goes straight out.  Every line that is
+#               allowed out at the same moment is coalesced into a single sendall().
+#
+# Twitch limits (per 30 seconds for messages, per 10 seconds for joins):
+#
+#     messages : 20 for normal accounts, 100 when the bot is a moderator
+#     joins    : 20 for normal accounts
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import threading
+import time
+from collections import deque
+
+
+
+class SlidingWindow:
+    def __init__(self, capacity, per, clock=time.monotonic):
+        '''
+        Allows at most capacity lines in any per seconds.  clock returns the
+        current time in seconds.
+        '''
+        self.capacity = capacity
+        self.per = per
+        self.clock = clock
+        self.sent = deque(maxlen=capacity)
+
+
+
+    def take(self, count=1):
+        '''
+        Records count sends if they are allowed now, returns whether it did.
+        '''
+        now = self.clock()
+        expiring = len(self.sent) + count - self.capacity
+        if expiring <= 0 or now - self.sent[expiring - 1] > self.per:
+            self.sent.extend([now] * count)
+            return True
+        return False
+
+
+
+    def wait_time(self, count=1):
+        '''
+        Seconds until count sends are allowed.
+        '''
+        expiring = len(self.sent) + count - self.capacity
+        if expiring <= 0:
+            return 0.0
+        return max(self.sent[expiring - 1] + self.per - self.clock(), 0.0)
+
+
+
+class SendQueue:
+    def __init__(self, sock=None, messageRate=(20, 30), joinRate=(20, 10)):
+        '''
+        - sock is the connected socket, it can be swapped with set_socket() on
+          a reconnect while lines are still queued.
+
+        - messageRate and joinRate are (lines, seconds) limits.
+        '''
+        self.sock = sock
+        self.messages = SlidingWindow(*messageRate)
+        self.joins = SlidingWindow(*joinRate)
+
+        self._urgent = deque()
+        self._chat = deque()
+        self._join = deque()
+        self._wake = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.sent = 0
+        self.writes = 0
+        self.errors = 0
+
+
+
+    def start(self):
+        '''
+        Starts the sender thread.
+        '''
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='SendQueue', daemon=True)
+            self._thread.start()
+        return self
+
+
+
+    def set_socket(self, sock):
+        '''
+        Sends queued and future lines to a new socket.
+        '''
+        with self._wake:
+            self.sock = sock
+            self._wake.notify()
+
+
+
+    def send(self, line):
+        '''
+        Queues one IRC line (without line ending) to be sent when allowed.
+        '''
+        command = line.split(' ', 1)[0]
+        with self._wake:
+            if command == 'PRIVMSG':
+                self._chat.append(line)
+            elif command == 'JOIN':
+                self._join.append(line)
+            else:
+                self._urgent.append(line)
+            self._wake.notify()
+
+
+
+    @property
+    def depth(self):
+        '''
+        Number of lines waiting to be sent.
+        '''
+        return len(self._urgent) + len(self._chat) + len(self._join)
+
+
+
+    def stop(self):
+        '''
+        Stops the sender thread, lines still waiting for their turn are dropped.
+        '''
+        with self._wake:
+            self._running = False
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+
+    def _ready(self):
+        '''
+        Takes every line that may go out now, returns them and the seconds to
+        wait before more could.
+        '''
+        lines = list(self._urgent)
+        self._urgent.clear()
+
+        wait = None
+        for waiting, window in ((self._join, self.joins), (self._chat, self.messages)):
+            while waiting and window.take():
+                lines.append(waiting.popleft())
+            if waiting:
+                delay = window.wait_time()
+                wait = delay if wait is None else min(wait, delay)
+
+        return lines, wait
+
+
+
+    def _run(self):
+        '''
+        Sender thread, writes every ready line in one sendall() then sleeps
+        until a line is queued or another send is allowed.
+        '''
+        while True:
+            with self._wake:
+                if not self._running:
+                    return
+                lines, wait = self._ready() if self.sock is not None else ([], None)
+                if not lines:
+                    self._wake.wait(wait)
+                    continue
+                sock = self.sock
+
+            try:
+                sock.sendall(''.join(line + '\r\n' for line in lines).encode('utf-8'))
+                self.sent += len(lines)
+                self.writes += 1
+            except OSError:
+                # The reader notices the broken connection and reconnects
+                self.errors += 1
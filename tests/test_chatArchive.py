@@ -0,0 +1,50 @@
+#########################################################################################
+#                               chatArchive round trip                                  #
+#########################################################################################
+# Converts a synthetic log into an archive and checks it reads back exactly the frame
+# get_chat_dataframe() gives for the text log.
+#
+#   Usage:  python -m pytest tests
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+import pandas as pd
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'benchmarks'))
+from processChat import get_chat_dataframe
+from chatArchive import ChatArchive, convert_log
+from syntheticChat import write_synthetic_log
+
+
+
+def test_archive_matches_text_log(tmp_path):
+    logFile = str(tmp_path / '#test_chat.log')
+    write_synthetic_log(logFile, 5000, channel='test', unicodeRate=0.1)
+    directory = str(tmp_path / 'archive')
+    convert_log(logFile, directory, segmentSize=1000)
+
+    text = get_chat_dataframe(logFile)
+    pd.testing.assert_frame_equal(get_chat_dataframe(directory), text)
+
+    start, end = text['dt'].iloc[1000], text['dt'].iloc[3000]
+    pd.testing.assert_frame_equal(get_chat_dataframe(directory, start=start, end=end),
+                                  get_chat_dataframe(logFile, start=start, end=end))
+
+
+
+def test_background_writer_keeps_every_message(tmp_path):
+    archive = ChatArchive(str(tmp_path / 'archive'), segmentSize=100).start()
+    for i in range(250):
+        archive.append(1600000000 + i, 'test', 'user%d' % (i % 7), 'message %d' % i)
+    archive.close()
+
+    chat = ChatArchive(str(tmp_path / 'archive')).read()
+    assert [segment['rows'] for segment in archive.index] == [100, 100, 50]
+    assert list(chat['message']) == ['message %d' % i for i in range(250)]
@@ -0,0 +1,64 @@
+#########################################################################################
+#                               chatEngine JOIN pacing                                  #
+#########################################################################################
+# Runs a pooled ChatEngine against a local server that records when every channel was
+# JOINed, and checks the JOINs of all connections together stay inside the limit.
+#
+#   Usage:  python -m pytest tests
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chatEngine import ChatEngine
+
+
+
+async def run_pooled(engine, runtime):
+    '''
+    Runs engine against a local server, returns the time of every channel JOIN.
+    '''
+    joins = []
+
+    async def client(reader, writer):
+        while True:
+            line = await reader.readline()
+            if len(line) == 0:
+                break
+            if line.startswith(b'JOIN '):
+                now = time.monotonic()
+                joins.extend(now for _ in line[5:].strip().split(b','))
+        writer.close()
+
+    server = await asyncio.start_server(client, '127.0.0.1', 0)
+    engine.port = server.sockets[0].getsockname()[1]
+    try:
+        await engine.run(runtime)
+    finally:
+        server.close()
+
+    return joins
+
+
+
+def test_pooled_joins_share_one_limit():
+    channels = ['#channel%d' % i for i in range(40)]
+    engine = ChatEngine('justinfan1', channels, server='127.0.0.1', token='oauth:x',
+                        channelsPerConnection=4, logChat=False)
+    engine.joinBatch = 5
+    engine.joinInterval = 0.5
+
+    joins = sorted(asyncio.run(run_pooled(engine, 5)))
+    assert len(joins) == len(channels)
+
+    # No window of joinInterval seconds holds more than joinBatch JOINs across
+    # connections, with some slack for when the server gets to read each line
+    for i in range(len(joins) - engine.joinBatch):
+        assert joins[i + engine.joinBatch] - joins[i] > 0.9 * engine.joinInterval
@@ -0,0 +1,41 @@
+#########################################################################################
+#                               chatNormalizer ASCII skip                               #
+#########################################################################################
+# Checks that only non-ASCII message text reaches the normalize function and its cache.
+#
+#   Usage:  python -m pytest tests
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chatMessage import parse_line
+from chatNormalizer import MessageNormalizer
+
+
+
+def test_non_ascii_tags_do_not_normalize_ascii_message():
+    calls = []
+    normalizer = MessageNormalizer(lambda text: calls.append(text) or text.upper())
+    line = ('@display-name=テスト;user-id=1 :test!test@test.tmi.twitch.tv '
+            'PRIVMSG #channel :plain message')
+
+    message = normalizer.normalize_message(parse_line(line))
+    assert message.message == 'plain message'
+    assert calls == []
+    assert normalizer.stats()['misses'] == 0
+
+
+
+def test_non_ascii_message_is_normalized():
+    normalizer = MessageNormalizer(lambda text: text.replace('é', 'e'))
+    line = ':test!test@test.tmi.twitch.tv PRIVMSG #channel :café'
+
+    message = normalizer.normalize_message(parse_line(line))
+    assert message.message == 'cafe'
+    assert message.raw.endswith(' :cafe')
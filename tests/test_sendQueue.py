@@ -0,0 +1,93 @@
+#########################################################################################
+#                               sendQueue rate limits                                   #
+#########################################################################################
+# Drives SlidingWindow with a fake clock and checks that no window of per seconds ever
+# holds more than capacity sends.
+#
+#   Usage:  python -m pytest tests
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sendQueue import SlidingWindow
+
+
+
+class FakeClock:
+    def __init__(self):
+        '''
+        Clock that only moves when advanced.
+        '''
+        self.now = 1000.0
+
+
+
+    def __call__(self):
+        '''
+        Current fake time in seconds.
+        '''
+        return self.now
+
+
+
+def send_greedily(window, clock, duration, step=0.01):
+    '''
+    Sends whenever window allows for duration seconds, returns the send times.
+    '''
+    sent = []
+    end = clock.now + duration
+    while clock.now < end:
+        while window.take():
+            sent.append(clock.now)
+        clock.now += max(window.wait_time(), step)
+    return sent
+
+
+
+def max_in_window(sent, per):
+    '''
+    Most sends in any window of per seconds.
+    '''
+    start = 0
+    most = 0
+    for end in range(len(sent)):
+        while sent[end] - sent[start] > per:
+            start += 1
+        most = max(most, end - start + 1)
+    return most
+
+
+
+def test_messages_never_exceed_limit():
+    clock = FakeClock()
+    sent = send_greedily(SlidingWindow(20, 30, clock), clock, 30)
+    assert len(sent) == 20
+    assert max_in_window(sent, 30) <= 20
+
+
+
+def test_joins_never_exceed_limit_over_many_windows():
+    clock = FakeClock()
+    sent = send_greedily(SlidingWindow(20, 10, clock), clock, 100)
+    assert max_in_window(sent, 10) <= 20
+    # The limit is still used, not just respected
+    assert len(sent) >= 180
+
+
+
+def test_wait_time():
+    clock = FakeClock()
+    window = SlidingWindow(2, 10, clock)
+    assert window.take() and window.take()
+    assert not window.take()
+    assert window.wait_time() == 10
+    clock.now += 4
+    assert window.wait_time() == 6
+    clock.now += 6.5
+    assert window.take()
@@ -12,29 +12,56 @@
 #
 #             - connect_socket : Connects a socket to irc using credentials.
 #
+#             - read_messages : Buffered reader shared by all chat methods, yields one
+#                               parsed ChatMessage per IRC line received.
+#
 #             - change_socket : Closes current socket, modifies credentials,
 #                               and reconnects to the new channel.
 #
+#             - send_chat : Queues a chat message, outbound lines are paced to the
+#                           Twitch rate limits by a SendQueue.
+#
+#             - reconnect : Reconnects with backoff and re-JOINs the channel, the
+#                           reader calls it when the connection drops so logging
+#                           carries on by itself.
+#
 #             - read_chat : Prints chat to console with no logging and no runtime.
 #
-#             - write_chat : Logs chat to #channel_chat.log over the runtime.
+#             - write_chat : Logs chat to #channel_chat.log over the runtime, records are
+#                            written in batches by a background ChatWriter.  Messages
+#                            can also be stored in a columnar ChatArchive and the log
+#                            kept searchable with a ChatIndex.  Copypasta and spam can
+#                            be stored as counts through a chatDedup.DuplicateFilter.
 #
 #             - vote_counter : Using a predefined voteLibrary.txt (csv), counter will 
-#                              log chat messages then load a data frame and check
-#                              messages for instances of voteLibrary.txt strings.
+#                              log chat messages and tally instances of voteLibrary.txt
+#                              strings live as each message arrives.
 #                              Votes can be counted by unique user or all together.
+#                              A live leaderboard can be published every few seconds
+#                              and counting can stop once a key reaches a threshold.
 #
 #             - contest : Using a predefined winningPhrase this parses messages 
 #                         and returns the username, message if the string matches.
-#                         Can also specify a number of winners.
+#                         Can also specify a number of winners, several phrases
+#                         can run at once through a ContestEngine.
+#
+#             - run : Reads chat once and hands every message to all the handlers
+#                     of a ChatDispatcher, so logging, votes and contests can run
+#                     together.
+#
+#
+#               **** One log record per IRC line ****
 #
+# Socket reads are split into complete IRC lines before anything else happens, so a
+# recv() chunk holding many messages is logged as many records and a message (or a
+# multi-byte character) cut across two chunks is held until the rest arrives.
 #
-#               **** Only reads messages that are timestamped ****
+# Set bot.capabilities = TWITCH_CAPABILITIES before connecting to receive IRCv3 tags,
+# messages then carry the Twitch user id, server timestamp and emote ranges.
 #
-# When the reader is activated the first batch of messages are not timestamped and will
-# not be caught by the logger due to the specific syntax.  Given these missed 
-# messages are in such a small amount for longer logging sessions I am just ignoring
-# it for the time being.
+# bot.metrics counts bytes, messages, PINGs and reconnects and times every stage of the
+# ingest loop (parse, normalize, write, dispatch), see chatMetrics.  bot.metrics.serve()
+# exposes them in Prometheus format, bot.metrics.profile() runs cProfile on a stage.
 #
 #
 #                  **** MAKE SURE YOU GET YOUR OAUTH TOKEN ****
@@ -48,14 +75,20 @@
 
 
 import socket
-import logging
-from emoji import demojize
+import random
 import time
-import progressbar
-from datetime import datetime
-import re
-import pandas as pd
-from processChat import get_chat_dataframe
+from chatMessage import parse_line, ChatRecord
+from voteTally import VoteTally, Leaderboard, load_vote_library
+from chatWriter import ChatWriter
+from chatNormalizer import MessageNormalizer
+from contestEngine import ContestEngine, Contest
+from sendQueue import SendQueue
+from chatMetrics import MetricsRegistry
+
+
+
+# Capabilities for structured messages, see chatMessage.ChatMessage
+TWITCH_CAPABILITIES = ['twitch.tv/tags', 'twitch.tv/membership']
 
 
 
@@ -82,6 +115,36 @@ class ChatBot:
         self.server = server
         self.port = port
 
+        # Normalization applied to each message before it is logged, None to disable
+        self.normalizer = MessageNormalizer()
+
+        # IRCv3 capabilities requested on connect, e.g. TWITCH_CAPABILITIES for tags
+        # (user ids, server timestamps, emotes) and JOIN/PART membership lines
+        self.capabilities = []
+
+        # Outbound lines are paced by the send queue, set messageRate to (100, 30) for a moderator
+        self.sendQueue = SendQueue()
+
+        # Reconnect with backoff when the connection drops, read timeout covers a silent socket
+        self.autoReconnect = True
+        self.maxBackoff = 60
+        self.readTimeout = 360
+        self.reconnects = 0
+
+        # Ingest counters, gauges and stage timings, see chatMetrics
+        self.metrics = MetricsRegistry()
+        self.metrics.counter('reconnects_total', 'Reconnects after a lost connection',
+                             function=lambda: self.reconnects)
+        self.metrics.counter('lines_sent_total', 'Lines written by the send queue',
+                             function=lambda: self.sendQueue.sent)
+        self.metrics.gauge('send_queue_depth', 'Lines waiting for the send rate limit',
+                           function=lambda: self.sendQueue.depth)
+
+        # Receive buffers, reused for the life of the bot
+        self.recvSize = 4096
+        self._recvChunk = bytearray(self.recvSize)
+        self._recvBuffer = bytearray()
+
         if token == None:
             print('\n\n*** Specificy an OAuth Token ***\n\n')
             return
@@ -100,12 +163,18 @@ class ChatBot:
 
         # Create and connect a socket
         self.sock = socket.socket()
+        self.sock.settimeout(self.readTimeout)
         self.sock.connect((self.server, self.port))
+        self._recvBuffer.clear()
 
-        # Connect the socket
-        self.sock.send(f"PASS {self.token}\n".encode('utf-8'))
-        self.sock.send(f"NICK {self.nickname}\n".encode('utf-8'))
-        self.sock.send(f"JOIN {self.channel}\n".encode('utf-8'))
+        # Log in directly, everything after goes through the send queue
+        login = f"PASS {self.token}\r\nNICK {self.nickname}\r\n"
+        if self.capabilities:
+            login = f"CAP REQ :{' '.join(self.capabilities)}\r\n" + login
+        self.sock.sendall(login.encode('utf-8'))
+        self.sendQueue.set_socket(self.sock)
+        self.sendQueue.start()
+        self.sendQueue.send(f"JOIN {self.channel}")
 
         print('\nConnection Successful')
 
@@ -138,148 +207,354 @@ class ChatBot:
         except:
             print('\nNo socket to change')
 
-        
 
-    def read_chat(self):
+
+    def send_chat(self, text):
         '''
-        Simply reads chat and prints raw output to console with no logging.
+        Queues a chat message to the channel, sent as the rate limit allows.
+        '''
+        self.sendQueue.send(f"PRIVMSG {self.channel} :{text}")
+
+
+
+    def reconnect(self):
+        '''
+        Closes the current socket and connects again, waiting 1, 2, 4 ... up
+        to maxBackoff seconds (plus jitter) between failed attempts.
         '''
+        delay = 1
         while True:
             try:
-                resp = self.sock.recv(2048).decode('utf-8')
-                print(resp)
-            except:
-                print('\nChat reading canceled.')
+                self.sock.close()
+            except OSError:
+                pass
+
+            print('\nConnection lost, reconnecting in %d seconds' % delay)
+            time.sleep(delay + random.random())
+            try:
+                self.connect_socket()
+                self.reconnects += 1
                 return
+            except OSError:
+                delay = min(delay * 2, self.maxBackoff)
+
+        
+
+    def read_messages(self):
+        '''
+        Generator yielding one parsed ChatMessage for every IRC line received.
+
+        Raw bytes are collected in a reusable buffer and only complete lines
+        ('\\r\\n' terminated) are decoded, so messages are never split or merged
+        at recv() boundaries.  Unconsumed lines stay in the buffer between calls.
+        PING is answered here and not yielded.
+
+        When the connection drops, times out or the server asks for a
+        RECONNECT the bot reconnects and reading carries on, unless
+        autoReconnect is False in which case ConnectionError is raised.
+        '''
+        chunk = memoryview(self._recvChunk)
+        buffer = self._recvBuffer
+        received = time.time()
+
+        bytesReceived = self.metrics.counter('bytes_received_total', 'Bytes read from the socket')
+        reads = self.metrics.counter('socket_reads_total', 'Socket reads')
+        parsed = self.metrics.counter('messages_parsed_total', 'IRC lines parsed')
+        pings = self.metrics.counter('pings_total', 'PINGs answered')
+        parseStage = self.metrics.stage('parse')
+
+        while True:
+            end = buffer.find(b'\n')
 
+            if end < 0:
+                try:
+                    size = self.sock.recv_into(chunk)
+                except OSError:
+                    size = 0
 
+                if size == 0:
+                    if self.autoReconnect == False:
+                        raise ConnectionError('Connection lost')
+                    self.reconnect()
+                    continue
 
-    def write_chat(self, runtime, showProgress=True, showChat=False):
+                buffer += chunk[:size]
+                received = time.time()
+                bytesReceived.inc(size)
+                reads.inc()
+                continue
+
+            with parseStage:
+                line = buffer[:end].rstrip(b'\r').decode('utf-8', errors='replace')
+                del buffer[:end + 1]
+                message = parse_line(line, received) if len(line) > 0 else None
+
+            if message is None:
+                continue
+            parsed.inc()
+
+            if message.command == 'PING':
+                self.sendQueue.send('PONG :' + message.message)
+                pings.inc()
+                continue
+
+            if message.command == 'RECONNECT' and self.autoReconnect == True:
+                self.reconnect()
+                continue
+
+            yield message
+
+
+
+    def read_chat(self):
         '''
-        Logs chat over the runtime to the channel's logFile in the directory.
+        Simply reads chat and prints raw output to console with no logging.
         '''
-        # Set up logging, for loop required, wasnt working without it
-        # Could also define my own file rather than using a handler
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
+        try:
+            for message in self.read_messages():
+                print(message.raw)
+        except:
+            print('\nChat reading canceled.')
+            return
+
 
-        logging.basicConfig(level=logging.DEBUG,
-                            format='%(asctime)s - %(message)s',
-                            datefmt='%Y-%m-%d_%H:%M:%S',
-                            handlers=[logging.FileHandler(self.logFile, encoding='utf-8')])
 
-        input('\nPress Enter to begin logging\n')
+    def write_chat(self, runtime, showProgress=True, showChat=False, onMessage=None,
+                   archive=None, prompt=True, index=None, dedup=None, until=None):
+        '''
+        Logs chat over the runtime to the channel's logFile in the directory, or
+        until stopped (Ctrl-C) when runtime is None.
+        onMessage(message) is called with every normalized ChatMessage as it is logged.
+        archive, a ChatArchive, also stores every chat message in columnar form,
+        its segments are written by the archive's own background thread.
+        index, a ChatIndex, is updated with the new records after each write
+        by a background IndexUpdater.
+        dedup, a DuplicateFilter, keeps repeated chat messages out of the log and
+        archive, a NOTICE record counting the dropped copies is logged instead.
+        until() is checked after every message, logging stops once it is True.
+        prompt waits for Enter before logging starts.
+        '''
+        # Records are written by a background thread so the receive loop never waits on disk
+        updater = None
+        if index is not None:
+            from chatIndex import IndexUpdater
+            updater = IndexUpdater(index, self.logFile).start()
+        writer = ChatWriter(self.logFile, onFlush=updater.notify if updater else None)
+        if archive is not None:
+            archive.start()
+        if dedup is not None:
+            from chatDedup import summary_line
+
+        if prompt == True:
+            input('\nPress Enter to begin logging\n')
         timer_start = time.time()
 
         # Setup progressbar
         if showProgress == True:
+            import progressbar
             widgets = ['Processed messages:  ', progressbar.Counter('%(value)05d'),
                        '     (', progressbar.Timer(), ')']
             bar = progressbar.ProgressBar(widgets=widgets)
 
-        while True:
-            # Loop during runtime and log messages as they come in
-            try:
-                resp = self.sock.recv(4096).decode('utf-8')
+        self.metrics.gauge('writer_queue_depth', 'Records waiting for the log writer',
+                           function=lambda: writer.depth)
+        self.metrics.counter('records_written_total', 'Records written to the log',
+                             function=lambda: writer.written)
+        normalizeStage = self.metrics.stage('normalize')
+        writeStage = self.metrics.stage('write')
 
+        # Loop during runtime and log messages as they come in, one record per line
+        writer.start()
+        try:
+            for message in self.read_messages():
                 if showChat == True:
-                    print(resp)
+                    print(message.raw)
                 elif showProgress == True:
-                    bar += 1  
-
-                if resp.startswith('PING'):
-                    self.sock.send('PONG\n'.encode('utf-8'))
-                elif len(resp) > 0:
-                    logging.info(demojize(resp))
+                    bar += 1
 
-            except:
-                logging.shutdown()
-                print('\nChat logging canceled')
-                if showProgress == True:
-                    bar.finish()
-                return
+                if self.normalizer is not None:
+                    with normalizeStage:
+                        message = self.normalizer.normalize_message(message)
+
+                with writeStage:
+                    keep = True
+                    if dedup is not None and message.command == 'PRIVMSG':
+                        keep = dedup.accept(message.message,
+                                            message.serverTime or message.received)
+                        for cluster in dedup.pop_expired():
+                            writer.write(summary_line(cluster, self.channel))
+                    if keep == True:
+                        writer.write(message.raw, message.serverTime)
+                        if archive is not None and message.command == 'PRIVMSG':
+                            archive.append_local(*ChatRecord.from_message(message))
+                if onMessage is not None:
+                    onMessage(message)
+
+                # Return after runtime and progressbar update
+                elapsed = abs(timer_start - time.time())
+                if ((runtime is not None and elapsed >= runtime)
+                        or (until is not None and until() == True)):
+                    self._flush_duplicates(dedup, writer)
+                    writer.close()
+                    if updater is not None:
+                        updater.close()
+                    if archive is not None:
+                        archive.close()
+                    if showProgress == True:
+                        bar.finish()
+                    print('\n%d seconds of chat logged from' % (elapsed), self.channel + '\n')
+                    return
 
-            # Return after runtime and progressbar update
-            if abs(timer_start - time.time()) >= runtime:
-                logging.shutdown()
-                if showProgress == True:
-                    bar.finish()
-                print('\n%d seconds of chat logged from' % (runtime), self.channel + '\n')
-                return
+        except:
+            self._flush_duplicates(dedup, writer)
+            writer.close()
+            if updater is not None:
+                updater.close()
+            if archive is not None:
+                archive.close()
+            print('\nChat logging canceled')
+            if showProgress == True:
+                bar.finish()
+            return
 
             
           
 
+    def _flush_duplicates(self, dedup, writer):
+        '''
+        Logs the counts of every copy dedup is still holding back.
+        '''
+        if dedup is None:
+            return
+        from chatDedup import summary_line
+        dedup.flush()
+        for cluster in dedup.pop_expired():
+            writer.write(summary_line(cluster, self.channel))
+
+
+
     def vote_counter(self, runtime, voteLibrary='voteLibrary.txt',
-                     showProgress=True, showChat=False, uniqueUsers=True):
+                     showProgress=True, showChat=False, uniqueUsers=True, prompt=True,
+                     dedup=None, threshold=None, bucketSeconds=None, snapshotInterval=None,
+                     onSnapshot=None, snapshotFile=None):
         '''
         Counts votes for entries specified in the voteLibrary file.
         Votes can be counted by only uniqueUserss or all votes total.
+        dedup, a DuplicateFilter, ignores a user repeating the same message.
+
+        Counting stops early once a key has threshold votes.  bucketSeconds
+        keeps the votes per key in each interval of that length.  With a
+        snapshotInterval the leaderboard is passed to onSnapshot and/or written
+        to snapshotFile every snapshotInterval seconds, and once more with the
+        full history at the end, see voteTally.Leaderboard.
+
         Returns a dictionary with vote Library keys to tallied values.
         '''
-        # Run a logging session and get the data frame
-        self.write_chat(runtime, showProgress, showChat)
-        chatLog = get_chat_dataframe(self.logFile)
-        chatLog.set_index('dt', inplace=True)
-
-        with open(voteLibrary, 'r') as f:
-            talliedVotes = {key:0 for key in f.read().split(', ')}
-
-        keys = list(talliedVotes)
-        messages = chatLog.values[:,1]
-
-        if uniqueUsers == True:
-            users = chatLog.values[:,2]
-            user_cache = []
-
-        for i in range(len(messages)):
-            for key in keys:
-                
-                # Unique votes
-                if uniqueUsers == True:
-                    if users[i] not in user_cache and key in messages[i]:
-                        talliedVotes[key] += 1
-                        user_cache.append(users[i])
-                
-                # All votes, maximum of 1 per message
-                else:
-                    if key in messages[i]:
-                        talliedVotes[key] += 1
+        # Tally votes live while logging, results are ready when the runtime ends
+        tally = VoteTally(load_vote_library(voteLibrary), uniqueUsers, dedup, bucketSeconds,
+                          threshold)
+        onMessage = tally.add_message
+        leaderboard = None
+        if snapshotInterval is not None:
+            leaderboard = Leaderboard(tally, snapshotInterval, onSnapshot, snapshotFile)
+            onMessage = leaderboard.add_message
+
+        until = None
+        if threshold is not None:
+            until = lambda: tally.winner is not None
+        self.write_chat(runtime, showProgress, showChat, onMessage=onMessage,
+                        prompt=prompt, until=until)
+        if leaderboard is not None:
+            leaderboard.publish(history=True)
+        talliedVotes = tally.results()
 
         return talliedVotes
     
     
 
-    def contest(self, winningPhrase, showProgress=True, showChat=False, winners=1):
+    def contest(self, winningPhrase, showProgress=True, showChat=False, winners=1,
+                ignoreCase=False, wholeWord=False):
         '''
         Reads incoming messages looking for a specific phrase, when found
         a winner is chosen and the message is printed.
+
+        winningPhrase can also be a list of phrases, each run as its own
+        contest with winners winners.  Returns the list of Winners found.
         '''
-        matches = 0
+        phrases = [winningPhrase] if isinstance(winningPhrase, str) else winningPhrase
+        engine = ContestEngine()
+        for phrase in phrases:
+            engine.add(Contest(phrase, winners, ignoreCase, wholeWord))
+        found = []
+        checkStage = self.metrics.stage('contest')
 
         if showProgress == True:
+            import progressbar
             print()
             bar = progressbar.ProgressBar(widgets=['Working: ', progressbar.AnimatedMarker()])
 
-        while True:
-            # Process raw chat inputs as they come in
-            try:
-                resp = self.sock.recv(2048).decode('utf-8')
-                username, message = re.search(':(.*)\\!.* :(.*)', resp).groups()
+        # Process every chat message as it comes in
+        try:
+            for message in self.read_messages():
+                if message.command != 'PRIVMSG':
+                    continue
 
-                if winningPhrase in message:
-                    print('\n\nWe have a winner :  ' + username + '  : ' + message)
-                    matches += 1
-                    if matches == winners:
-                        return
+                with checkStage:
+                    found += engine.check(message)
+                if not engine.active:
+                    return found
 
                 if showChat == True:
-                    print(resp)
+                    print(message.raw)
                 if showProgress == True:
                     bar += 1
 
-            except:
-                print('\nContest canceled')
-                return
+        except:
+            print('\nContest canceled')
+            return found
+
 
 
+    def run(self, dispatcher, runtime=None, showProgress=True):
+        '''
+        Reads chat and dispatches every normalized ChatMessage to the handlers
+        registered on dispatcher, for runtime seconds or until Ctrl-C when
+        runtime is None.  The dispatcher is closed before returning.
+        '''
+        if showProgress == True:
+            import progressbar
+            widgets = ['Processed messages:  ', progressbar.Counter('%(value)05d'),
+                       '     (', progressbar.Timer(), ')']
+            bar = progressbar.ProgressBar(widgets=widgets)
+
+        for name in dispatcher.stats():
+            self.metrics.gauge('handler_queue_depth', 'Messages waiting for each handler',
+                               function=lambda name=name: dispatcher.stats()[name]['depth'],
+                               handler=name)
+        normalizeStage = self.metrics.stage('normalize')
+        dispatchStage = self.metrics.stage('dispatch')
+
+        timer_start = time.time()
+        dispatcher.start()
+        try:
+            for message in self.read_messages():
+                if self.normalizer is not None:
+                    with normalizeStage:
+                        message = self.normalizer.normalize_message(message)
+                with dispatchStage:
+                    dispatcher.dispatch(message)
+
+                if showProgress == True:
+                    bar += 1
+
+                if runtime is not None and abs(timer_start - time.time()) >= runtime:
+                    print('\n%d seconds of chat handled from' % (runtime), self.channel + '\n')
+                    break
+
+        except:
+            print('\nChat handling canceled')
+
+        finally:
+            dispatcher.close()
+            if showProgress == True:
+                bar.finish()
@@ -0,0 +1,290 @@
+#########################################################################################
+#                                Live vote tallying                                     #
+#########################################################################################
+# Tallies votes from chat messages as they arrive rather than logging chat and parsing
+# the log afterwards.
+#
+#   KeywordMatcher : Aho-Corasick automaton built once over every vote key, a message
+#                    is scanned a single time no matter how many keys there are.
+#
+#   VoteTally : Feeds each chat message through the matcher and keeps the counts.
+#               Unique voters are tracked in a set so each check is O(1).  With a
+#               chatDedup.DuplicateFilter a voter repeating the same or nearly the
+#               same message inside its window only counts once, so counting every
+#               vote cannot be stuffed by spamming.
+#
+#               bucketSeconds keeps a history of the votes per key in each interval
+#               and threshold marks the first key to reach that many votes as the
+#               winner, so counting can stop early.  snapshot() is the current
+#               leaderboard, built from the running counts in O(keys).
+#
+#   Leaderboard : Publishes a tally's snapshot every interval seconds to a callback
+#                 and/or a JSON file while votes come in.
+#
+#   load_vote_library : Reads the keys from a voteLibrary.txt style file.
+#
+#########################################################################################
+#########################################################################################
+
+
+
+import os
+import json
+import time
+from collections import deque
+
+
+
+def load_vote_library(voteLibrary):
+    '''
+    Returns the list of vote keys in a comma separated voteLibrary file.
+    '''
+    with open(voteLibrary, 'r', encoding='utf-8') as f:
+        keys = [key.strip() for key in f.read().split(', ')]
+    return [key for key in keys if key]
+
+
+
+class KeywordMatcher:
+    def __init__(self, keywords):
+        '''
+        Builds the Aho-Corasick automaton for keywords.  The index of a keyword
+        in the list is what find() reports for it.
+        '''
+        self.keywords = list(keywords)
+
+        # Node 0 is the root, each node has transitions, a failure link and outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for index, keyword in enumerate(self.keywords):
+            node = 0
+            for character in keyword:
+                nextNode = self._goto[node].get(character)
+                if nextNode is None:
+                    nextNode = len(self._goto)
+                    self._goto[node][character] = nextNode
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nextNode
+            if keyword:
+                self._out[node] += (index,)
+
+        # Breadth first pass to set failure links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and character not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(character, 0)
+                self._fail[child] = fail if fail != child else 0
+                self._out[child] += self._out[self._fail[child]]
+
+
+
+    def find(self, text):
+        '''
+        Returns the set of keyword indices that occur anywhere in text.
+        '''
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        node = 0
+
+        for character in text:
+            while node and character not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(character, 0)
+            if out[node]:
+                found.update(out[node])
+
+        return found
+
+
+
+class VoteTally:
+    def __init__(self, keys, uniqueUsers=True, dedup=None, bucketSeconds=None, threshold=None):
+        '''
+        - keys is the list of vote keys, counts are reported in the same order.
+
+        - uniqueUsers counts only the first vote of each user, otherwise every
+          message counts once for each key it contains.
+
+        - dedup is a DuplicateFilter, messages it rejects for their user are
+          not counted.
+
+        - bucketSeconds records the votes per key in every interval of that
+          many seconds in history.
+
+        - threshold sets winner to the first key reaching that many votes.
+        '''
+        self.keys = list(keys)
+        self.uniqueUsers = uniqueUsers
+        self.dedup = dedup
+        self.bucketSeconds = bucketSeconds
+        self.threshold = threshold
+        self.matcher = KeywordMatcher(self.keys)
+        self.counts = [0] * len(self.keys)
+        self.voters = set()
+        self.messages = 0
+        self.ignored = 0
+        self.winner = None
+
+        # [interval start, counts per key] for every interval with votes
+        self.history = []
+
+
+
+    def add(self, username, message, stamp=None):
+        '''
+        Tallies a single chat message from username sent at stamp (seconds,
+        default now).
+        '''
+        self.messages += 1
+        if stamp is None:
+            stamp = time.time()
+
+        if self.dedup is not None and not self.dedup.accept(message, stamp, username):
+            self.ignored += 1
+            return
+
+        if self.uniqueUsers == True:
+            if username in self.voters:
+                return
+            found = self.matcher.find(message)
+            if found:
+                # A user's vote goes to the first key in library order
+                self._count(min(found), stamp)
+                self.voters.add(username)
+        else:
+            for index in self.matcher.find(message):
+                self._count(index, stamp)
+
+
+
+    def _count(self, index, stamp):
+        '''
+        Adds one vote for the key at index.
+        '''
+        self.counts[index] += 1
+
+        if self.bucketSeconds is not None:
+            start = stamp - stamp % self.bucketSeconds
+            if not self.history or self.history[-1][0] != start:
+                self.history.append([start, [0] * len(self.keys)])
+            self.history[-1][1][index] += 1
+
+        if (self.winner is None and self.threshold is not None
+                and self.counts[index] >= self.threshold):
+            self.winner = self.keys[index]
+
+
+
+    def add_message(self, message):
+        '''
+        Tallies a parsed ChatMessage, anything other than PRIVMSG is ignored.
+        Unique voters are tracked by Twitch user id when the message has tags.
+        '''
+        if message.command == 'PRIVMSG':
+            voter = message.userId
+            self.add(message.username if voter is None else voter, message.message,
+                     message.serverTime or message.received)
+
+
+
+    def results(self):
+        '''
+        Returns a dictionary of vote key to tallied votes.
+        '''
+        return dict(zip(self.keys, self.counts))
+
+
+
+    def leaderboard(self):
+        '''
+        List of (key, votes) with the most votes first, ties in library order.
+        '''
+        order = sorted(range(len(self.keys)), key=lambda index: -self.counts[index])
+        return [(self.keys[index], self.counts[index]) for index in order]
+
+
+
+    def snapshot(self, history=False):
+        '''
+        Dictionary of the current standings, the votes of the latest interval
+        when bucketSeconds is set, and every interval when history.
+        '''
+        snapshot = {'time': time.time(), 'messages': self.messages,
+                    'votes': sum(self.counts), 'ignored': self.ignored,
+                    'leaderboard': self.leaderboard(), 'winner': self.winner}
+        if self.bucketSeconds is not None:
+            snapshot['bucketSeconds'] = self.bucketSeconds
+            snapshot['latest'] = None
+            if self.history:
+                start, counts = self.history[-1]
+                snapshot['latest'] = {'start': start, 'votes': dict(zip(self.keys, counts))}
+            if history == True:
+                snapshot['history'] = [{'start': start, 'votes': dict(zip(self.keys, counts))}
+                                       for start, counts in self.history]
+        return snapshot
+
+
+
+class Leaderboard:
+    def __init__(self, tally, interval=5, onSnapshot=None, snapshotFile=None):
+        '''
+        Publishes tally.snapshot() at most every interval seconds.
+
+        - onSnapshot(snapshot) is called with each snapshot.
+
+        - snapshotFile is replaced with each snapshot as JSON, readers never
+          see a partly written file.
+        '''
+        self.tally = tally
+        self.interval = interval
+        self.onSnapshot = onSnapshot
+        self.snapshotFile = snapshotFile
+        self.published = 0
+        self._next = time.time() + interval
+
+
+
+    def add_message(self, message):
+        '''
+        Tallies a parsed ChatMessage and publishes when a snapshot is due.
+        '''
+        self.tally.add_message(message)
+        self.tick()
+
+
+
+    def tick(self, now=None):
+        '''
+        Publishes a snapshot if interval seconds passed since the last one.
+        '''
+        now = time.time() if now is None else now
+        if now >= self._next:
+            self.publish()
+            self._next = now + self.interval
+
+
+
+    def publish(self, history=False):
+        '''
+        Publishes a snapshot now and returns it.
+        '''
+        snapshot = self.tally.snapshot(history)
+        if self.onSnapshot is not None:
+            self.onSnapshot(snapshot)
+        if self.snapshotFile is not None:
+            with open(self.snapshotFile + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(self.snapshotFile + '.tmp', self.snapshotFile)
+        self.published += 1
+        return snapshot